@@ -0,0 +1,143 @@
+"""Load tests the sync (gunicorn) and ASGI (gunicorn with a uvicorn
+worker, see src.asgi) servers side by side, one worker each, over a
+synthetic catalog. Each is sent searches by a growing number of
+concurrent clients; with the sync worker requests queue up behind each
+other, so throughput stays flat as clients are added, while the ASGI
+worker overlaps their time waiting on the database.
+
+Usage:
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_asgi \\
+        [--games 100000] [--clients 1,4,16,64] [--requests 400] [--output report.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import create_bench_app, print_table, reset_tables, summarize
+from benchmarks.bench_endpoints import SEARCH_TERMS
+
+SERVERS = {
+    'sync': ['gunicorn', '-w', '1', "src:create_serving_app('src.config.TestConfig')"],
+    'asgi': ['gunicorn', '-w', '1', '-k', 'uvicorn.workers.UvicornWorker',
+             "src.asgi:create_asgi_app('src.config.TestConfig')"],
+}
+
+
+def start_server(command, port):
+    """Starts a server on `port`, waiting until it answers.
+    """
+    env = dict(
+        os.environ,
+        # Every request comes from the same address, and should reach the database:
+        RATELIMIT_ENABLED='0',
+        RESPONSE_CACHE_BACKEND='none',
+        QUERY_INSTRUMENTATION='0',
+        METRICS_ENABLED='0',
+    )
+    process = subprocess.Popen(
+        command[:1] + ['-b', f'127.0.0.1:{port}', '--log-level', 'warning'] + command[1:],
+        env=env, stdout=subprocess.DEVNULL, stderr=sys.stderr
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/v1/pulse', timeout=1)
+            return process
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{command} did not start')
+
+
+def drive(port, clients, requests, seed):
+    """Sends `requests` searches from `clients` threads. Returns
+    (timings, errors, wall seconds).
+    """
+    def client_loop(number):
+        rng = random.Random(seed + number)
+        timings, errors = [], 0
+        for _ in range(requests // clients):
+            query = urllib.parse.quote(rng.choice(SEARCH_TERMS))
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/v1/games/search?query={query}', timeout=60).read()
+            except (urllib.error.URLError, ConnectionError):
+                errors += 1
+            timings.append(time.perf_counter() - start)
+        return timings, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(client_loop, range(clients)))
+    wall = time.perf_counter() - start
+    return [t for timings, _ in results for t in timings], sum(errors for _, errors in results), wall
+
+
+def run(args):
+    app = create_bench_app()
+    from src.database import db
+    from src.seeding import synthesize_games
+
+    with app.app_context():
+        reset_tables(db)
+        synthesize_games(db.engine, args.games)
+
+    results = []
+    try:
+        for number, (mode, command) in enumerate(SERVERS.items()):
+            port = args.port + number
+            server = start_server(command, port)
+            try:
+                for clients in sorted(int(n) for n in args.clients.split(',')):
+                    drive(port, clients, clients * 2, args.seed)  # warm up
+                    timings, errors, wall = drive(port, clients, args.requests, args.seed)
+                    results.append({
+                        'server': mode,
+                        'clients': clients,
+                        'errors': errors,
+                        'throughput_rps': round(len(timings) / wall, 1),
+                        **summarize(timings)
+                    })
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        with app.app_context():
+            reset_tables(db)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--clients', default='1,4,16,64')
+    parser.add_argument('--requests', type=int, default=400, help='Requests per server and number of clients')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the results here as JSON (as well as printing them)')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+    print_table(
+        f'Searches over {args.games} games, one worker each',
+        [{key: result[key] for key in ('server', 'clients', 'throughput_rps', 'p50_ms', 'p95_ms', 'errors')}
+         for result in results]
+    )
+
+
+if __name__ == '__main__':
+    main()
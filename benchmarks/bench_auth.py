@@ -0,0 +1,95 @@
+"""Benchmarks per-request auth latency for `requires_auth`, with and
+without the signing key (JWKS) and verified-token caches. A local HTTP
+server stands in for Auth0 (so "no caching" numbers are a lower bound:
+real fetches also pay a TLS round trip to Auth0).
+
+Usage:
+    python -m benchmarks.bench_auth [--iterations 500]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rsa
+from jose import jwk, jwt
+
+from benchmarks.common import summarize, time_calls, print_table
+
+
+def serve_jwks(public_jwk):
+    body = json.dumps({"keys": [public_jwk]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f'http://127.0.0.1:{httpd.server_port}/.well-known/jwks.json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ['AUTH0_DOMAIN'] = 'wswp.bench'
+    os.environ['AUTH0_API_AUDIENCE'] = 'wswp-api'
+
+    from src import create_app
+    from src.auth import requires_auth, jwks_cache, token_cache
+
+    public_key, private_key = rsa.newkeys(2048)
+    public_jwk = jwk.construct(public_key.save_pkcs1().decode(), 'RS256').to_dict()
+    public_jwk.update(kid='bench', use='sig')
+    httpd, url = serve_jwks(public_jwk)
+
+    token = jwt.encode(
+        {'sub': 'admin', 'aud': 'wswp-api', 'iss': 'https://wswp.bench/', 'exp': int(time.time()) + 3600},
+        private_key.save_pkcs1().decode(), algorithm='RS256', headers={'kid': 'bench'}
+    )
+
+    app = create_app('src.config.TestConfig')
+    app.config['ADMIN_OFF'] = False
+
+    @requires_auth
+    def protected(current_user=None):
+        return current_user
+
+    def call():
+        with app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+            protected()
+
+    scenarios = [
+        ('no caching', 0, 0),
+        ('JWKS cache', 600, 0),
+        ('JWKS + token cache', 600, 256),
+    ]
+    rows = []
+    for name, jwks_ttl, token_cache_size in scenarios:
+        jwks_cache.clear()
+        jwks_cache.url = url
+        jwks_cache.ttl = jwks_ttl
+        token_cache.clear()
+        token_cache.max_entries = token_cache_size
+
+        call()  # warm up
+        rows.append({'scenario': name, **summarize(time_calls(call, args.iterations))})
+
+    httpd.shutdown()
+    print_table(f'requires_auth latency ({args.iterations} calls, same token)', rows)
+
+
+if __name__ == '__main__':
+    main()
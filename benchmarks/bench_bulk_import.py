@@ -0,0 +1,92 @@
+"""Benchmarks bulk importing games, comparing the old path (validate
+everything with ActivitySchema(many=True), build an Activity per game,
+add_all and commit) against src.bulk.import_games, with and without
+skipping duplicate URLs. Reports wall time, games/s and peak Python
+memory allocated.
+
+Usage:
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_bulk_import [--games 100000]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.common import create_bench_app, reset_tables, print_table
+
+
+def synthetic_games(n):
+    """Yields n games, as they'd be posted to /admin/bulk_import.
+    """
+    for i in range(n):
+        yield {
+            'name': f'Cosmic Heist {i}',
+            'url': f'https://example.com/games/{i}',
+            'description': 'An online bluffing game set in a haunted castle. Play with friends over video chat.',
+            'paid': i % 4 == 0,
+            'min_players': 1 + i % 6,
+            'max_players': None if i % 3 == 0 else 8,
+            'created_date': '2021-01-01T12:00:00',
+            'submitted_by': 'benchmark'
+        }
+
+
+def measure(fn):
+    """Runs fn(), returning (seconds taken, peak KiB allocated).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, round(peak / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    from src.bulk import import_games
+    from src.database import db
+    from src.model import Activity
+    from src.schema import ActivitySchema
+
+    def old_import():
+        validated = ActivitySchema(many=True).load(list(synthetic_games(args.games)))
+        db.session.add_all([Activity(**game) for game in validated])
+        db.session.commit()
+
+    def new_import(skip_duplicates):
+        report = import_games(synthetic_games(args.games), chunk_size=args.chunk_size,
+                              skip_duplicates=skip_duplicates)
+        assert report.inserted == args.games and not report.errors
+
+    paths = [
+        ('before (ORM add_all)', old_import),
+        ('after (chunked Core insert)', lambda: new_import(False)),
+        ('after, skipping duplicates', lambda: new_import(True)),
+    ]
+
+    rows = []
+    with app.app_context():
+        for label, fn in paths:
+            reset_tables(db)
+            elapsed, peak_kib = measure(fn)
+            db.session.remove()
+            rows.append({
+                'path': label,
+                'seconds': round(elapsed, 2),
+                'games_per_s': round(args.games / elapsed),
+                'peak_kib': peak_kib
+            })
+        reset_tables(db)
+
+    print_table(f'Importing {args.games} games', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Benchmarks the public read endpoints over synthetic catalogs of
+several sizes. Each endpoint is driven through the WSGI app by a number
+of concurrent clients (threads, as in a threaded worker), recording
+throughput, latency percentiles and SQL statements per request.
+
+Results are written as JSON (sorted, one result per catalog size and
+endpoint), so reports from two commits can be diffed, or compared with
+--compare.
+
+Usage:
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_endpoints \\
+        [--sizes 1000,10000,100000,1000000] [--clients 8] [--requests 400] [--output report.json]
+    python -m benchmarks.bench_endpoints --compare before.json after.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from benchmarks.common import create_bench_app, reset_tables, summarize, print_table
+
+SEARCH_TERMS = ['heist', 'deduction', 'cosmic castle', 'escape room', 'drawing game', 'nothingmatchesthis']
+
+
+def endpoint_urls(size):
+    """Returns, for each endpoint, a function building a random URL to
+    request from it (given a random.Random).
+    """
+    return {
+        'games': lambda rng: f'/v1/games?page={rng.randint(1, min(50, max(1, size // 20)))}',
+        'search': lambda rng: f'/v1/games/search?query={rng.choice(SEARCH_TERMS)}',
+        'random': lambda rng: f'/v1/games/random?players={rng.randint(1, 8)}&free_only={rng.choice(["true", "false"])}',
+        'game': lambda rng: f'/v1/games/{rng.randint(1, size)}',
+    }
+
+
+class StatementCounter(object):
+    """Counts SQL statements run on an engine (from any thread).
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def drive(app, make_url, clients, requests, seed):
+    """Sends `requests` requests, spread over `clients` threads, each
+    with its own test client. Returns (timings, errors, wall seconds).
+    """
+    timings, errors = [], []
+    lock = threading.Lock()
+
+    def client_loop(number):
+        rng = random.Random(seed + number)
+        client = app.test_client()
+        local_timings, local_errors = [], 0
+        for _ in range(requests // clients):
+            url = make_url(rng)
+            start = time.perf_counter()
+            response = client.get(url)
+            local_timings.append(time.perf_counter() - start)
+            # A random game that doesn't exist (deleted, or no match) is a fine answer:
+            if response.status_code not in (200, 404):
+                local_errors += 1
+        with lock:
+            timings.extend(local_timings)
+            errors.append(local_errors)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client_loop, range(clients)))
+    return timings, sum(errors), time.perf_counter() - start
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    app = create_bench_app()
+    from src.auth import limiter
+    from src.cache import response_cache
+    from src.database import db
+    from src.seeding import synthesize_games
+    from src.selection import random_index
+
+    # Every client shares an address, which the rate limits would throttle:
+    limiter.enabled = False
+    if not args.response_cache:
+        response_cache.backend = None
+
+    results = []
+    with app.app_context():
+        reset_tables(db)
+        counter = StatementCounter(db.engine)
+
+        for size in sorted(int(size) for size in args.sizes.split(',')):
+            # Generation is idempotent, so each size only adds the difference:
+            synthesize_games(db.engine, size)
+            random_index.invalidate()
+
+            for endpoint, make_url in endpoint_urls(size).items():
+                drive(app, make_url, args.clients, args.clients * 5, args.seed)  # warm up
+                statements_before = counter.count
+                timings, errors, wall = drive(app, make_url, args.clients, args.requests, args.seed)
+                results.append({
+                    'catalog_size': size,
+                    'endpoint': endpoint,
+                    'clients': args.clients,
+                    'errors': errors,
+                    'throughput_rps': round(len(timings) / wall, 1),
+                    'queries_per_request': round((counter.count - statements_before) / len(timings), 2),
+                    **summarize(timings)
+                })
+
+        reset_tables(db)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'clients': args.clients,
+            'requests': args.requests,
+            'response_cache': args.response_cache,
+        },
+        'results': results
+    }
+
+
+def compare(before_path, after_path):
+    """Prints how throughput and latency changed between two reports.
+    """
+    with open(before_path) as file:
+        before = {(r['catalog_size'], r['endpoint']): r for r in json.load(file)['results']}
+    with open(after_path) as file:
+        after = json.load(file)['results']
+
+    def change(old, new):
+        return f'{100 * (new - old) / old:+.1f}%' if old else 'n/a'
+
+    rows = []
+    for result in after:
+        old = before.get((result['catalog_size'], result['endpoint']))
+        if old is None:
+            continue
+        rows.append({
+            'catalog_size': result['catalog_size'],
+            'endpoint': result['endpoint'],
+            'throughput': change(old['throughput_rps'], result['throughput_rps']),
+            'p50': change(old['p50_ms'], result['p50_ms']),
+            'p95': change(old['p95_ms'], result['p95_ms']),
+            'p99': change(old['p99_ms'], result['p99_ms']),
+            'queries': f"{old['queries_per_request']} -> {result['queries_per_request']}",
+        })
+    print_table(f'{before_path} -> {after_path}', rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400, help='Requests per endpoint and catalog size')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--response-cache', action='store_true', help='Leave the response cache on')
+    parser.add_argument('--output', help='Write the JSON report here (as well as printing a summary)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two reports instead')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+    print_table(
+        f"Public endpoints, {args.clients} concurrent clients (commit {report['meta']['commit']})",
+        [{key: result[key] for key in ('catalog_size', 'endpoint', 'throughput_rps', 'p50_ms', 'p95_ms',
+                                       'p99_ms', 'queries_per_request', 'errors')}
+         for result in report['results']]
+    )
+
+
+if __name__ == '__main__':
+    main()
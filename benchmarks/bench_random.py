@@ -0,0 +1,91 @@
+"""Benchmarks /games/random's game selection at several catalog sizes,
+comparing the old approach (load every eligible Activity, pick an ID
+with random.choice, fetch it again) against Activity.random and the
+in-process RandomGameIndex. Reports latency and peak Python memory
+allocated per pick, plus the index's size and rebuild time.
+
+Usage:
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_random [--sizes 10000,100000,1000000]
+"""
+
+import argparse
+import random
+import tracemalloc
+
+from sqlalchemy import or_
+
+from benchmarks.common import (create_bench_app, reset_tables, seed_synthetic_activities,
+                               summarize, time_calls, print_table)
+
+
+def old_random_game(Activity, players, free_only):
+    game_query = Activity.query.filter(
+        Activity.min_players <= players,
+        or_(Activity.max_players >= players, Activity.max_players.is_(None))
+    )
+    if free_only:
+        game_query = game_query.filter(Activity.paid == False)
+    ids = [game.id for game in game_query.all()]
+    return Activity.query.get(random.choice(ids)) if ids else None
+
+
+def peak_memory(fn):
+    """Returns the peak memory (in KiB) Python allocated during fn().
+    """
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--players', type=int, default=4)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    from src.database import db
+    from src.model import Activity
+    from src.selection import random_index
+
+    strategies = {
+        'old (load all, random.choice)': lambda: old_random_game(Activity, args.players, True),
+        'Activity.random': lambda: Activity.random(args.players, free_only=True),
+        'RandomGameIndex': lambda: random_index.random_game(args.players, free_only=True),
+    }
+    index_rows = []
+
+    rows = []
+    with app.app_context():
+        for size in (int(size) for size in args.sizes.split(',')):
+            reset_tables(db)
+            seed_synthetic_activities(db, size)
+
+            random_index.invalidate()
+            random_index.rebuild()
+            index_rows.append({'rows': size, 'index_ids': random_index.size,
+                               'index_kib': round(random_index.nbytes / 1024, 1),
+                               'rebuild_ms': round(random_index.last_rebuild_seconds * 1000, 1)})
+
+            for name, pick in strategies.items():
+                def call():
+                    pick()
+                    # Don't let the identity map carry objects between picks:
+                    db.session.remove()
+
+                call()  # warm up
+                memory = peak_memory(call)
+                rows.append({'rows': size, 'strategy': name, 'peak_kib': memory,
+                             **summarize(time_calls(call, args.iterations))})
+
+        reset_tables(db)
+
+    print_table(f'Random game selection ({args.players} players, free only)', rows)
+    print_table('RandomGameIndex size and rebuild time', index_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Benchmarks game search latency over a large synthetic catalog,
+comparing the old per-row `to_tsvector(...)` predicate against the
+stored, GIN-indexed `search_vector` column. Each search is timed as a
+count query plus a page query, as `Activity.search` issued them.
+
+Usage:
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_search [--rows 100000]
+"""
+
+import argparse
+
+from sqlalchemy import text
+
+from benchmarks.common import (create_bench_app, reset_tables, seed_synthetic_activities,
+                               summarize, time_calls, print_table)
+
+PREDICATES = {
+    'before (to_tsvector per row)': "to_tsvector(name || ' ' || coalesce(description, '')) @@ plainto_tsquery(:searchparam)",
+    'after (search_vector + GIN)': "search_vector @@ plainto_tsquery('english', :searchparam)",
+}
+
+SEARCH_TERMS = ['heist', 'deduction', 'cosmic castle', 'escape room', 'nothingmatchesthis']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--per-page', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    from src.database import db
+
+    with app.app_context():
+        reset_tables(db)
+        seed_synthetic_activities(db, args.rows)
+
+        rows = []
+        for label, predicate in PREDICATES.items():
+            count_query = text(f"select count(1) from activity where {predicate}")
+            page_query = text(f"select * from activity where {predicate} limit :limit offset 0")
+
+            for term in SEARCH_TERMS:
+                def search():
+                    with db.engine.connect() as connection:
+                        connection.execute(count_query, {'searchparam': term}).fetchone()
+                        connection.execute(page_query, {'searchparam': term, 'limit': args.per_page}).fetchall()
+
+                search()  # warm up
+                rows.append({'query': label, 'term': term, **summarize(time_calls(search, args.iterations))})
+
+        reset_tables(db)
+
+    print_table(f'Search latency over {args.rows} games ({args.iterations} runs per term)', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Benchmarks turning a page of games into a JSON response, comparing the
+old path (ActivitySchema().dump over ORM objects, then jsonify) against
+src.serializers (dicts straight from rows, encoded by the stdlib's C
+encoder), for 20, 100 and 1000-game pages. Both produce the same bytes.
+
+By default only serialization is timed, over games built in memory, so
+no database is needed. With --database, loading the page is timed too
+(ORM objects vs. Core rows) against a synthetic catalog.
+
+Usage:
+    python -m benchmarks.bench_serialize [--sizes 20,100,1000]
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_serialize --database
+"""
+
+import argparse
+import datetime
+from collections import namedtuple
+
+from flask import jsonify
+from sqlalchemy import select
+
+from benchmarks.common import (create_bench_app, reset_tables, seed_synthetic_activities,
+                               summarize, time_calls, print_table)
+
+
+def synthetic_games(Activity, n):
+    """Returns n games both as (transient) ORM objects and as rows.
+    """
+    from src.model import ACTIVITY_FIELDS
+
+    Row = namedtuple('Row', ACTIVITY_FIELDS)
+    rows = [
+        Row(
+            id=i, name=f'Cosmic Heist {i}', url=f'https://example.com/games/{i}',
+            description='An online bluffing game set in a haunted castle. Play with friends over video chat.',
+            paid=i % 4 == 0, min_players=1 + i % 6, max_players=None if i % 3 == 0 else 8,
+            created_date=datetime.datetime(2021, 1, 1) + datetime.timedelta(minutes=i),
+            submitted_by='benchmark'
+        )
+        for i in range(1, n + 1)
+    ]
+    return [Activity(**row._asdict()) for row in rows], rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='20,100,1000')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--database', action='store_true', help='Time loading each page as well')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    app = create_bench_app()
+    from src.database import db
+    from src.model import Activity
+    from src.schema import ActivitySchema
+    from src.serializers import dump_games, json_response
+
+    def old_response(games):
+        return jsonify(games=ActivitySchema().dump(games, many=True), page=1).get_data()
+
+    def new_response(rows):
+        return json_response(dict(games=dump_games(rows), page=1)).get_data()
+
+    results = []
+    with app.test_request_context():
+        if args.database:
+            reset_tables(db)
+            seed_synthetic_activities(db, max(sizes))
+
+        for n in sizes:
+            if args.database:
+                order = (Activity.created_date.desc(), Activity.id.desc())
+                load_old = lambda: Activity.query.order_by(*order).limit(n).all()
+                load_new = lambda: db.session.execute(
+                    select(*Activity.public_columns()).order_by(*order).limit(n)
+                ).all()
+            else:
+                games, rows = synthetic_games(Activity, n)
+                load_old, load_new = lambda: games, lambda: rows
+
+            assert old_response(load_old()) == new_response(load_new())
+
+            def before():
+                old_response(load_old())
+                db.session.expunge_all()
+
+            def after():
+                new_response(load_new())
+
+            for label, fn in (('before (schema + jsonify)', before), ('after (serializers)', after)):
+                fn()  # warm up
+                results.append({'games': n, 'path': label, **summarize(time_calls(fn, args.iterations))})
+
+        if args.database:
+            reset_tables(db)
+
+    timed = 'Loading and serializing' if args.database else 'Serializing'
+    print_table(f'{timed} a page of games ({args.iterations} runs each)', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Measures how long a fresh process takes to start serving: importing
+the app's modules, running its factory and answering a first request
+(/v1/pulse, which doesn't touch the database). On a machine that was
+stopped while idle, this is added to the first request's latency.
+
+Each factory is run in `--runs` new interpreters (so nothing is already
+imported), and the median of each step is reported. The full factory
+(create_app, used by the `flask` CLI) is compared with the serving one
+(create_serving_app, used by gunicorn), and the ASGI one. To see which
+modules take longest to import:
+
+    python -X importtime -c "import src" 2>&1 | sort -t'|' -k2 -n | tail
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 10] [--config src.config.ProdConfig] [--output report.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import print_table
+
+FACTORIES = {
+    'full': ('src', 'create_app'),
+    'serving': ('src', 'create_serving_app'),
+    'asgi': ('src.asgi', 'create_asgi_app'),
+}
+
+# Run in each new interpreter, printing its timings as JSON:
+PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+app = getattr(module, sys.argv[2])(sys.argv[3])
+created = time.perf_counter()
+flask_app = getattr(app, 'app', app)
+response = flask_app.test_client().get('/v1/pulse')
+assert response.status_code == 200, response.status_code
+responded = time.perf_counter()
+print(json.dumps({
+    'import_ms': 1000 * (imported - start),
+    'create_ms': 1000 * (created - imported),
+    'first_response_ms': 1000 * (responded - created),
+    'modules': len(sys.modules),
+}))
+"""
+
+
+def probe(module, factory, config):
+    """Starts an interpreter that creates an app and answers one
+    request. Returns its timings, along with the wall time from
+    starting the process to its answer.
+    """
+    env = dict(
+        os.environ,
+        # Engines are created without connecting, so any URL will do:
+        DATABASE_URL=os.getenv('DATABASE_URL', 'postgresql://wswp@localhost/wswp'),
+        SENTRY_DSN='',
+    )
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, module, factory, config],
+        env=env, check=True, capture_output=True, text=True
+    ).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings['process_ms'] = 1000 * (time.perf_counter() - start)
+    return timings
+
+
+def run(args):
+    results = []
+    for name, (module, factory) in FACTORIES.items():
+        probe(module, factory, args.config)  # warm up the filesystem cache and .pyc files
+        runs = [probe(module, factory, args.config) for _ in range(args.runs)]
+        results.append({
+            'factory': name,
+            'modules': runs[0]['modules'],
+            **{key: round(statistics.median(run[key] for run in runs), 1)
+               for key in ('import_ms', 'create_ms', 'first_response_ms', 'process_ms')}
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--config', default='src.config.ProdConfig')
+    parser.add_argument('--output', help='Write the results here as JSON (as well as printing them)')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+    print_table(f'Cold start, median of {args.runs} runs ({args.config})', results)
+
+
+if __name__ == '__main__':
+    main()
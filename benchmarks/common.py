@@ -0,0 +1,83 @@
+"""Helpers shared by the benchmark scripts in this package.
+"""
+
+import math
+import os
+import time
+
+def create_bench_app():
+    """Creates an application object pointed at the benchmark database
+    (BENCH_DATABASE_URL, falling back to TEST_DATABASE_URL). The
+    benchmarks create, fill and drop tables here, so don't point it at
+    anything you care about.
+    """
+    url = os.getenv('BENCH_DATABASE_URL') or os.getenv('TEST_DATABASE_URL')
+    if url:
+        os.environ['TEST_DATABASE_URL'] = url
+
+    from src import create_app
+    return create_app('src.config.TestConfig')
+
+
+def reset_tables(db):
+    """Drops and recreates all tables (and their indexes).
+    """
+    db.metadata.drop_all(bind=db.engine, checkfirst=True)
+    db.metadata.create_all(bind=db.engine, checkfirst=True)
+
+
+def seed_synthetic_activities(db, n, seed=0.42):
+    """Inserts n synthetic games into the activity table (see
+    src.seeding.synthesize_games), then refreshes planner statistics.
+    """
+    from src.seeding import synthesize_games
+    synthesize_games(db.engine, n, seed=seed)
+
+
+def percentile(samples, pct):
+    """Returns the pct-th percentile (0-100) of a list of samples,
+    using the nearest-rank method.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Summarizes a list of timings (in seconds) as a dict of
+    milliseconds.
+    """
+    return {
+        'n': len(samples),
+        'mean_ms': round(1000 * sum(samples) / len(samples), 3),
+        'p50_ms': round(1000 * percentile(samples, 50), 3),
+        'p95_ms': round(1000 * percentile(samples, 95), 3),
+        'p99_ms': round(1000 * percentile(samples, 99), 3),
+    }
+
+
+def time_calls(fn, iterations):
+    """Calls fn `iterations` times, returning a list of how long each
+    call took (in seconds).
+    """
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def print_table(title, rows):
+    """Prints a list of dicts (all with the same keys) as a table.
+    """
+    print(f'\n{title}')
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    widths = [max(len(str(h)), *(len(str(row[h])) for row in rows)) for h in headers]
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
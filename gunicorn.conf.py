@@ -0,0 +1,25 @@
+"""Gunicorn settings. Workers record Prometheus metrics to files in
+PROMETHEUS_MULTIPROC_DIR, so /metrics can report all of them; the
+directory is emptied when gunicorn starts, and a worker's live gauges
+are dropped when it exits.
+"""
+
+import os
+import shutil
+
+bind = os.getenv('BIND', ':8000')
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# This has to be set before the app (and prometheus_client) is imported:
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/wswp-metrics')
+
+
+def on_starting(server):
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
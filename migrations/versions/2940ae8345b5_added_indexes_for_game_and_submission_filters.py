@@ -0,0 +1,45 @@
+"""added indexes for game listing/random filters and the pending submissions queue
+
+Revision ID: 2940ae8345b5
+Revises: cc70e575d4c5
+Create Date: 2026-10-18 11:26:51.904316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2940ae8345b5'
+down_revision = 'cc70e575d4c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so the tables stay writable while the indexes
+    # build (which can't happen inside a transaction):
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_activity_paid_created_date_id', 'activity',
+            ['paid', 'created_date', 'id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_activity_players', 'activity',
+            ['min_players', 'max_players', 'paid'],
+            unique=False, postgresql_include=['id'], postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_submissions_pending', 'submissions',
+            ['created_date'],
+            unique=False, postgresql_where=sa.text('NOT archived AND NOT approved'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_submissions_pending', table_name='submissions', postgresql_concurrently=True)
+        op.drop_index('ix_activity_players', table_name='activity', postgresql_concurrently=True)
+        op.drop_index('ix_activity_paid_created_date_id', table_name='activity', postgresql_concurrently=True)
@@ -0,0 +1,31 @@
+"""added url index on activity, for deduplicating bulk imports
+
+Revision ID: 5c1e9d2a7b34
+Revises: 2940ae8345b5
+Create Date: 2026-10-18 14:02:17.530211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e9d2a7b34'
+down_revision = '2940ae8345b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Not unique: several games can share a site. Built concurrently
+    # so the table stays writable while it builds:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_activity_url', 'activity', ['url'],
+            unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_activity_url', table_name='activity', postgresql_concurrently=True)
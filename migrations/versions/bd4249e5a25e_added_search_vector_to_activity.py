@@ -0,0 +1,37 @@
+"""added weighted search_vector column (with GIN index) to activity
+
+Revision ID: bd4249e5a25e
+Revises: b6008ed2743e
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'bd4249e5a25e'
+down_revision = 'b6008ed2743e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Generated columns need PostgreSQL 12+. Adding a stored column
+    # rewrites the table, so existing rows are populated here too.
+    op.add_column('activity', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+            persisted=True
+        ),
+        nullable=True
+    ))
+    op.create_index('ix_activity_search_vector', 'activity', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_activity_search_vector', table_name='activity', postgresql_using='gin')
+    op.drop_column('activity', 'search_vector')
@@ -0,0 +1,24 @@
+"""added (created_date, id) index on activity for keyset pagination
+
+Revision ID: cc70e575d4c5
+Revises: bd4249e5a25e
+Create Date: 2026-10-18 10:02:13.540117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cc70e575d4c5'
+down_revision = 'bd4249e5a25e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_activity_created_date_id', 'activity', ['created_date', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_activity_created_date_id', table_name='activity')
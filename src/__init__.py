@@ -1,21 +1,29 @@
 import os
 
 from flask import Flask
-from flask_migrate import Migrate
+from sqlalchemy.pool import QueuePool
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import find_dotenv, load_dotenv
-import sentry_sdk
-from sentry_sdk.integrations.flask import FlaskIntegration
 
 from src.routes import api
-from src.cli import cli_bp
-from src.auth import cors, limiter
+from src.auth import cors, limiter, jwks_cache, token_cache
+from src.cache import response_cache
+from src.instrumentation import query_instrumentation
+from src.metrics import TimedQueuePool, metrics, metrics_bp
+from src.replicas import replica_router
+from src.ratelimit import init_limiter
 
 
-def create_app(config='src.config.DevConfig'):
+def create_app(config='src.config.DevConfig', serving=False):
     """Main application factory for WSWP. Will set up all config params,
     load up environment variables and bind things as needed (i.e. binding
     the app object to SQLAlchemy)
 
+    With `serving`, only what's needed to answer requests is set up:
+    Flask-Migrate, Marshmallow's app binding and the admin CLI commands
+    (along with the seed data they import) are left out, so the app
+    starts faster. See create_serving_app.
+
     Returns an application object.
     """
 
@@ -27,6 +35,12 @@ def create_app(config='src.config.DevConfig'):
     app = Flask(__name__)
     app.config.from_object(config)
 
+    # Behind a load balancer, clients' addresses come from the headers
+    # it adds (only trusting as many hops as there are proxies):
+    if app.config['TRUSTED_PROXIES']:
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
     if app.config['ADMIN_OFF']:
         app.logger.info("Note: admin endpoints have been disabled!")
 
@@ -35,27 +49,70 @@ def create_app(config='src.config.DevConfig'):
     # SENTRY_ENVIRONMENT variable
     if config != 'src.config.TestConfig':
         # We don't want to initialize Sentry in testing -- it'd kill the logs
+        # (It's set up first thing even when serving, so it catches
+        # errors from the first request. Rather than trying to import
+        # every library it has an integration for, it's only given the
+        # ones we use.)
+        import sentry_sdk
+        from sentry_sdk.integrations.flask import FlaskIntegration
+        from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
         sentry_sdk.init(
-            integrations=[FlaskIntegration()],
+            integrations=[FlaskIntegration(), SqlalchemyIntegration()],
+            auto_enabling_integrations=False,
             traces_sample_rate=0.5
         )
 
-    from src.database import db
-    from src.schema import ma
+    from src.database import db, engine_options
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(
+        app.config, poolclass=TimedQueuePool if app.config['METRICS_ENABLED'] else QueuePool
+    ))
+    if app.config['DB_PGBOUNCER'] and app.config['DB_STATEMENT_TIMEOUT_MS']:
+        app.logger.warning("DB_STATEMENT_TIMEOUT_MS is ignored with DB_PGBOUNCER; set it on the database role")
+    # Replicas are added as binds, so this has to come first:
+    replica_router.init_app(app)
     db.init_app(app)
     from src.model import Activity, Submission
-    migrate = Migrate(app, db)
-    ma.init_app(app)
+    from src.selection import random_index
+    if not serving:
+        # Alembic and the schemas are slow to import, and only needed
+        # by `flask db` commands and the views that load submissions
+        # (which import them when first called):
+        from flask_migrate import Migrate
+        from src.schema import ma
+        migrate = Migrate(app, db)
+        ma.init_app(app)
+    random_index.init_app(app)
+    response_cache.init_app(app)
+    query_instrumentation.init_app(app)
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app)
 
     # Register cross-origin resource sharing and rate limiting modules:
     cors.init_app(app)
-    limiter.init_app(app)
+    init_limiter(limiter, app)
+    jwks_cache.init_app(app)
+    token_cache.max_entries = app.config['AUTH_TOKEN_CACHE_SIZE']
+    token_cache.clear()
 
     # Associate all handlers of the Flask logger instance:
     for handler in app.logger.handlers:
         limiter.logger.addHandler(handler)
 
     app.register_blueprint(api, url_prefix='/v1')
-    app.register_blueprint(cli_bp)
+    if not serving:
+        from src.cli import cli_bp
+        app.register_blueprint(cli_bp)
+    if app.config['METRICS_ENABLED']:
+        app.register_blueprint(metrics_bp)
+        # Scrapers shouldn't be throttled (or use up clients' quota):
+        limiter.exempt(metrics_bp)
     
-    return app
\ No newline at end of file
+    return app
+
+
+def create_serving_app(config='src.config.ProdConfig'):
+    """Application factory for serving the API (under gunicorn, say),
+    which starts up faster than create_app. Machines are stopped when
+    idle, so a cold start is part of some requests' latency.
+    """
+    return create_app(config, serving=True)
\ No newline at end of file
@@ -0,0 +1,336 @@
+"""ASGI entry point, for serving with an async worker:
+
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker \\
+        "src.asgi:create_asgi_app('src.config.ProdConfig')"
+
+The public read endpoints in ASYNC_ENDPOINTS are served in the event
+loop, with their queries going through asyncpg. They're the same Flask
+views, with the same rate limits, error handlers and caching, but each
+request runs in a greenlet (as SQLAlchemy's asyncio extension runs sync
+ORM code), so while one waits on the database the loop carries on with
+others. Every other request is handed to the WSGI app in a pool of
+ASGI_THREADS threads.
+
+/games/random stays on the threads: it's answered from the in-memory
+random index, whose rebuilds hold a thread lock while querying, which
+would stall the event loop.
+
+Only queries go through asyncpg: anything else a request does that
+blocks, like talking to Redis with redis-py, blocks the event loop (and
+every request in it) too. So if the response cache or the rate limiter
+keeps its data in Redis (RESPONSE_CACHE_BACKEND=redis, or a redis://
+RATELIMIT_STORAGE_URI), every request is served on the threads instead.
+
+Requests served on the threads read their body as it arrives (see
+ReceiveStream), so an upload like /games/import isn't held in memory
+first. The async endpoints are GETs: their bodies, if any, are read
+up front, and refused (with a 413) past ASYNC_MAX_BODY bytes. Either
+way, bodies over MAX_CONTENT_LENGTH are refused.
+"""
+
+import asyncio
+import io
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from flask import request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import greenlet_spawn
+from werkzeug.exceptions import ClientDisconnected, HTTPException, RequestEntityTooLarge
+
+import src.handlers as handlers
+from src import create_app
+from src.database import db, engine_options
+from src.metrics import metrics
+
+ASYNC_ENDPOINTS = ('api.games', 'api.search_games', 'api.get_game')
+
+# Connection string parameters for libpq (psycopg2) that asyncpg takes
+# differently, or not at all (see async_url and async_engine_options):
+LIBPQ_PARAMS = ('sslmode', 'connect_timeout', 'application_name', 'options')
+
+# The most a request to one of ASYNC_ENDPOINTS may send as its body
+# (unless MAX_CONTENT_LENGTH is lower):
+ASYNC_MAX_BODY = 64 * 1024
+
+
+def create_asgi_app(config='src.config.DevConfig'):
+    """Application factory for serving over ASGI. Sets up the Flask app
+    as create_app does (in serving mode), and wraps it.
+    """
+    return AsyncApp(create_app(config, serving=True))
+
+
+class AsyncApp(object):
+    """ASGI application wrapping a Flask app (see the module docstring).
+    Each of the Flask app's engines gets an asyncpg twin, with the same
+    URL and pool settings.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=app.config['ASGI_THREADS'])
+        self.async_engines = {}
+        self.blocking_backends = blocking_backends(app.config)
+        self._twins = []
+
+        if self.blocking_backends:
+            app.logger.warning(
+                f"Serving every request on threads, as these would block the event loop: "
+                f"{', '.join(self.blocking_backends)}"
+            )
+
+        with app.app_context():
+            for bind_key, engine in db.engines.items():
+                twin = create_async_engine(async_url(engine.url, app.config), **async_engine_options(app.config, engine.url))
+                self.async_engines[engine] = twin.sync_engine
+                self._twins.append(twin)
+                if app.config['METRICS_ENABLED']:
+                    metrics.watch_engine(twin.sync_engine, f"{bind_key or 'default'}_async")
+
+        # This has to run before any other hook might query:
+        app.before_request_funcs.setdefault(None, []).insert(0, self._use_async_engines)
+        app.register_error_handler(OSError, self._handle_connection_error)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        environ = wsgi_environ(scope)
+        if self.runs_async(environ):
+            limit = min(ASYNC_MAX_BODY, self.app.config['MAX_CONTENT_LENGTH'] or ASYNC_MAX_BODY)
+            try:
+                environ['wsgi.input'] = io.BytesIO(await read_body(receive, limit))
+            except RequestEntityTooLarge as error:
+                status, headers, body = self.call_wsgi(environ, error)
+            else:
+                environ['wswp.async'] = True
+                status, headers, body = await greenlet_spawn(self.call_wsgi, environ)
+        else:
+            loop = asyncio.get_running_loop()
+            environ['wsgi.input'] = io.BufferedReader(
+                ReceiveStream(receive, loop, self.app.config['MAX_CONTENT_LENGTH'])
+            )
+            status, headers, body = await loop.run_in_executor(self.executor, self.call_wsgi, environ)
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def runs_async(self, environ):
+        """Whether a request is for one of ASYNC_ENDPOINTS.
+        """
+        if self.blocking_backends or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return False
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return False
+        return endpoint in ASYNC_ENDPOINTS
+
+    def call_wsgi(self, environ, app=None):
+        """Runs a request through the Flask app (or another WSGI app, like
+        an HTTPException), returning its status, headers (in ASGI form)
+        and body.
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        result = (app or self.app)(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], body
+
+    def _use_async_engines(self):
+        if request.environ.get('wswp.async'):
+            db.session.info['async_engines'] = self.async_engines
+
+    def _handle_connection_error(self, error):
+        # asyncpg raises failures to connect as they are, where psycopg2's
+        # are wrapped in SQLAlchemy errors (with their own handler):
+        if not request.environ.get('wswp.async'):
+            raise error
+        return handlers.handle_database_error(error)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for twin in self._twins:
+                    await twin.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def blocking_backends(config):
+    """Settings that have requests make blocking calls other than
+    database queries (see the module docstring).
+    """
+    backends = []
+    if config.get('RESPONSE_CACHE_BACKEND') == 'redis':
+        backends.append('RESPONSE_CACHE_BACKEND=redis')
+    storage = urlparse(config.get('RATELIMIT_STORAGE_URI', 'memory://')).scheme
+    if config.get('RATELIMIT_ENABLED', True) and storage not in ('memory', 'bounded-memory'):
+        backends.append(f'RATELIMIT_STORAGE_URI={storage}://')
+    return backends
+
+
+def async_url(url, config):
+    """The asyncpg version of a PostgreSQL URL. libpq's sslmode becomes
+    asyncpg's ssl (which takes the same modes), and its other
+    parameters are left to async_engine_options. Behind PgBouncer,
+    asyncpg's prepared statement caches are turned off, since the
+    server connection a statement was prepared on isn't kept.
+    """
+    url = make_url(url)
+    query = {key: value for key, value in url.query.items() if key not in LIBPQ_PARAMS}
+    if 'sslmode' in url.query:
+        query['ssl'] = url.query['sslmode']
+    if config['DB_PGBOUNCER']:
+        query['prepared_statement_cache_size'] = '0'
+    return url.set(drivername='postgresql+asyncpg', query=query)
+
+
+def async_engine_options(config, url):
+    """The engine options from engine_options, as asyncpg takes them,
+    along with the connection string's libpq parameters: connect_timeout
+    as the connection timeout, and application_name and the settings
+    in options (`-c name=value`) as server settings.
+    """
+    options = engine_options(config, poolclass=AsyncAdaptedQueuePool)
+    options.pop('connect_args', None)
+    query = make_url(url).query
+    connect_args = {}
+    server_settings = dict(re.findall(r'(?:-c\s*|--)([\w.]+)=(\S+)', query.get('options', '')))
+    if 'connect_timeout' in query:
+        connect_args['timeout'] = float(query['connect_timeout'])
+    if 'application_name' in query:
+        server_settings['application_name'] = query['application_name']
+
+    if config['DB_PGBOUNCER']:
+        connect_args['statement_cache_size'] = 0
+    elif config['DB_STATEMENT_TIMEOUT_MS']:
+        server_settings['statement_timeout'] = str(config['DB_STATEMENT_TIMEOUT_MS'])
+    if server_settings:
+        connect_args['server_settings'] = server_settings
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+async def read_body(receive, limit):
+    """Reads a whole request body, raising RequestEntityTooLarge once it's
+    over `limit` bytes.
+    """
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        size += len(chunks[-1])
+        if size > limit:
+            raise RequestEntityTooLarge()
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class ReceiveStream(io.RawIOBase):
+    """A request body as a file, for a WSGI app running on another thread
+    than the event loop: each read waits for the next chunk from
+    `receive` (on the loop) if none is left over from the last one.
+    Raises RequestEntityTooLarge once more than `limit` bytes arrive.
+    """
+
+    def __init__(self, receive, loop, limit=None):
+        self.receive = receive
+        self.loop = loop
+        self.limit = limit
+        self._chunk = memoryview(b'')
+        self._received = 0
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Reaching the limit, we wait to see if the body ends there, as
+        # Werkzeug stops reading at MAX_CONTENT_LENGTH (without a 413):
+        while not self._done and (not self._chunk or self._at_limit()):
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            if message['type'] != 'http.request':
+                # The client went away before sending all of it:
+                self._done = True
+                raise ClientDisconnected()
+            body = message.get('body', b'')
+            self._received += len(body)
+            if self.limit is not None and self._received > self.limit:
+                raise RequestEntityTooLarge()
+            if body:
+                self._chunk = memoryview(body)
+            self._done = not message.get('more_body')
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def _at_limit(self):
+        return self.limit is not None and self._received >= self.limit
+
+
+def wsgi_environ(scope, body=b''):
+    """Builds the WSGI environ for an ASGI HTTP request. Its input
+    is `body`, unless it's replaced with a ReceiveStream; either way
+    it ends where the body does (wsgi.input_terminated), so Werkzeug
+    reads bodies without a Content-Length, and applies
+    MAX_CONTENT_LENGTH to those too.
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            # (Cookies are the one header not joined with commas.)
+            value = f"{environ[key]}{'; ' if key == 'HTTP_COOKIE' else ','}{value}"
+        environ[key] = value
+    return environ
@@ -3,18 +3,25 @@ JWTs before accessing private endpoints. Also controls cross-origin
 resource sharing and rate limiting throughout the application.
 """
 
-import json, os
+import hashlib, json, os
 from functools import wraps
 from flask import request, current_app
-from jose import jwt
-import requests
 from flask_limiter import Limiter, util
 from flask_cors import CORS
 
 from src.exceptions import AuthError, InvalidUsage
+from src.cache import LRUCache
+from src.jwks import JWKSCache
+from src.metrics import record_rate_limit
 
-limiter = Limiter(key_func=util.get_remote_address, default_limits=["10/second;1000/day"])
+limiter = Limiter(
+    key_func=util.get_remote_address,
+    default_limits=["10/second;1000/day"],
+    on_breach=record_rate_limit
+)
 cors = CORS()
+jwks_cache = JWKSCache()
+token_cache = LRUCache()
 
 
 def get_token_auth_header():
@@ -32,10 +39,52 @@ def get_token_auth_header():
     return token
 
 
+def verify_token(token):
+    """Verifies the signature and claims of a token against Auth0's
+    signing keys, returning its payload.
+    """
+    # python-jose (and the crypto backend it loads) is slow to import,
+    # and only private endpoints need it:
+    from jose import jwt
+
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError("Authorization token given in the incorrect format")
+
+    # Look up the signing key in our cached JSON Web Key Set:
+    try:
+        rsa_key = jwks_cache.get_key(unverified_header.get("kid"))
+    except Exception as e:
+        current_app.logger.error(f'Could not fetch JWKS: {e}')
+        raise AuthError("Unable to fetch signing keys", status_code=503)
+
+    if not rsa_key:
+        raise AuthError("Unable to find required key")
+
+    try:
+        return jwt.decode(
+            token,
+            rsa_key,
+            algorithms=["RS256"],
+            audience=os.getenv('AUTH0_API_AUDIENCE'),
+            issuer="https://"+os.getenv('AUTH0_DOMAIN')+"/"
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthError("Authorization token expired")
+    except jwt.JWTClaimsError:
+        raise AuthError("Incorrect claims")
+    except Exception:
+        raise AuthError("Authorization failed")
+
+
 def requires_auth(f):
     """Wraps a function view to determine if a given access
     token is valid before accessing a resource. Populates the
     current_user parameter on any view function.
+
+    Verified tokens are cached (by their hash) until they expire, so
+    repeat calls with the same token skip signature verification.
     """
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -45,37 +94,14 @@ def requires_auth(f):
 
         # Get token from Authorization: Bearer <Token> header
         token = get_token_auth_header()
-        # Look through known JSON Web Key Sets:
-        known_req = requests.get(f'https://{os.getenv("AUTH0_DOMAIN")}/.well-known/jwks.json')
-        jwks = known_req.json()
-        unverified_header = jwt.get_unverified_header(token)
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-        
-        if rsa_key:
-            try:
-                payload = jwt.decode(
-                    token,
-                    rsa_key,
-                    algorithms=["RS256"],
-                    audience=os.getenv('AUTH0_API_AUDIENCE'),
-                    issuer="https://"+os.getenv('AUTH0_DOMAIN')+"/"
-                )
-            except jwt.ExpiredSignatureError:
-                raise AuthError("Authorization token expired")
-            except jwt.JWTClaimsError:
-                raise AuthError("Incorrect claims")
-            except Exception:
-                raise AuthError("Authorization failed")
-
-            return f(*args, **kwargs, current_user=payload)
-        raise AuthError("Unable to find required key")
-    return decorated
\ No newline at end of file
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+
+        payload = token_cache.get(token_hash)
+        if payload is None:
+            payload = verify_token(token)
+            # Tokens without an expiry aren't worth the risk of caching:
+            if isinstance(payload.get("exp"), (int, float)):
+                token_cache.set(token_hash, payload, expires_at=payload["exp"])
+
+        return f(*args, **kwargs, current_user=payload)
+    return decorated
@@ -0,0 +1,231 @@
+"""Backups of the game tables, as compressed newline-delimited JSON. Rows
+are streamed out of Postgres with a server-side cursor and compressed
+on the way to storage, so a table is never held in memory.
+
+A backup is a folder of files (one per table) plus a manifest.json
+recording each file's row count and SHA-256. The manifest is written
+last, so a folder without one is an incomplete backup.
+"""
+
+import contextlib
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+from sqlalchemy import select
+
+from src.database import db
+from src.model import ACTIVITY_FIELDS, Activity, Submission
+
+COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+# Columns written out for each table (activity's search_vector is left
+# out, since Postgres computes it):
+BACKUP_COLUMNS = {
+    'activity': [Activity.__table__.c[field] for field in ACTIVITY_FIELDS],
+    'submissions': list(Submission.__table__.c),
+}
+
+
+class LocalStorage(object):
+    """Stores backups in a directory on this machine.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __str__(self):
+        return self.directory
+
+    @contextlib.contextmanager
+    def open_write(self, name):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            yield file
+
+    @contextlib.contextmanager
+    def open_read(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as file:
+            yield file
+
+
+class S3Storage(object):
+    """Stores backups in an S3-compatible bucket (under `prefix`). Files
+    are spooled to a temporary file, then uploaded in parts by boto3,
+    which needs to be installed unless a `client` is passed in.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def __str__(self):
+        return f's3://{self.bucket}/{self.prefix}'
+
+    def key_for(self, name):
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    @contextlib.contextmanager
+    def open_write(self, name):
+        with tempfile.TemporaryFile() as file:
+            yield file
+            file.seek(0)
+            self.client.upload_fileobj(file, self.bucket, self.key_for(name))
+
+    @contextlib.contextmanager
+    def open_read(self, name):
+        with tempfile.TemporaryFile() as file:
+            self.client.download_fileobj(self.bucket, self.key_for(name), file)
+            file.seek(0)
+            yield file
+
+
+def storage_for(target, s3_endpoint_url=None):
+    """Returns storage for a target: either s3://bucket/prefix or a
+    local directory.
+    """
+    if target.startswith('s3://'):
+        bucket, _, prefix = target[len('s3://'):].partition('/')
+        return S3Storage(bucket, prefix, endpoint_url=s3_endpoint_url)
+    return LocalStorage(target)
+
+
+class HashingWriter(object):
+    """Passes writes through to a file, counting bytes and hashing them
+    on the way.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+@contextlib.contextmanager
+def compressed_writer(file, compression):
+    """Wraps a binary file in a compressing writer.
+    """
+    if compression == 'gzip':
+        with gzip.GzipFile(fileobj=file, mode='wb', mtime=0) as writer:
+            yield writer
+    elif compression == 'zstd':
+        import zstandard
+        with zstandard.ZstdCompressor().stream_writer(file, closefd=False) as writer:
+            yield writer
+    else:
+        raise ValueError(f'Unknown compression: {compression}')
+
+
+def decompressed_reader(file, compression):
+    """Wraps a binary file in a decompressing reader.
+    """
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    if compression == 'zstd':
+        import zstandard
+        # Buffered, so it can be read line by line:
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True))
+    if compression is None:
+        return file
+    raise ValueError(f'Unknown compression: {compression}')
+
+
+def to_json(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def backup_name(now=None):
+    """Time-stamped name of a backup folder, e.g. games-20210115T123000Z.
+    """
+    now = now or datetime.datetime.utcnow()
+    return f"games-{now.strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def backup_tables(storage, tables=('activity',), compression='gzip', name=None, batch_size=5000):
+    """Streams each table into a compressed NDJSON file under a new
+    backup folder in `storage`, then writes the manifest. All tables
+    are read from the same snapshot. Returns the manifest.
+    """
+    name = name or backup_name()
+    manifest = {
+        'name': name,
+        'created_date': datetime.datetime.utcnow().isoformat(),
+        'format': 'ndjson',
+        'compression': compression,
+        'tables': {}
+    }
+
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level='REPEATABLE READ')
+        with connection.begin():
+            for table in tables:
+                columns = BACKUP_COLUMNS[table]
+                statement = select(*columns).order_by(columns[0].table.c.id)
+                file_name = f'{table}.ndjson{COMPRESSIONS[compression]}'
+
+                with storage.open_write(f'{name}/{file_name}') as file:
+                    hashing = HashingWriter(file)
+                    rows = 0
+                    with compressed_writer(hashing, compression) as writer:
+                        result = connection.execution_options(
+                            stream_results=True, yield_per=batch_size
+                        ).execute(statement)
+                        # Rows arrive batch_size at a time from the server-side cursor:
+                        for batch in result.mappings().partitions():
+                            writer.write(''.join(
+                                json.dumps(dict(row), separators=(',', ':'), default=to_json) + '\n'
+                                for row in batch
+                            ).encode())
+                            rows += len(batch)
+
+                manifest['tables'][table] = {
+                    'file': file_name,
+                    'rows': rows,
+                    'bytes': hashing.size,
+                    'sha256': hashing.sha256.hexdigest()
+                }
+
+    with storage.open_write(f'{name}/manifest.json') as file:
+        file.write(json.dumps(manifest, indent=2).encode())
+
+    return manifest
+
+
+def read_manifest(storage, name):
+    with storage.open_read(f'{name}/manifest.json') as file:
+        return json.load(file)
+
+
+def verify_backup(storage, name):
+    """Checks every file in a backup against the manifest, returning a
+    list of problems (empty if it's intact).
+    """
+    manifest = read_manifest(storage, name)
+    problems = []
+    for entry in manifest['tables'].values():
+        sha256 = hashlib.sha256()
+        with storage.open_read(f"{name}/{entry['file']}") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                sha256.update(block)
+        if sha256.hexdigest() != entry['sha256']:
+            problems.append(f"{entry['file']} doesn't match its checksum")
+    return problems
@@ -0,0 +1,191 @@
+"""Bulk loading of games (e.g. when migrating to another server). Games
+are validated and inserted in fixed-size chunks through Core, so only
+one chunk is held in memory at a time and no ORM objects are built.
+"""
+
+import datetime
+import itertools
+import json
+
+from flask import current_app
+from marshmallow import ValidationError
+from sqlalchemy import cast, column, exists, insert, select, values
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.cache import response_cache
+from src.database import db
+from src.model import ACTIVITY_FIELDS, Activity
+from src.schema import ActivitySchema
+from src.selection import random_index
+
+# Everything but the ID (which the database assigns) can be imported:
+IMPORT_FIELDS = tuple(field for field in ACTIVITY_FIELDS if field != 'id')
+
+# Fields are sent for every game (executemany needs the same keys on
+# each), so the defaults Activity would otherwise fill in live here:
+IMPORT_DEFAULTS = {'paid': False, 'min_players': 1}
+
+
+class ImportReport(object):
+    """Tally of a bulk import: how many games were inserted, skipped as
+    duplicates or rejected as invalid, plus any problems, by chunk.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.chunks = 0
+        self.errors = []
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'skipped': self.skipped,
+            'rejected': self.rejected,
+            'chunks': self.chunks,
+            'errors': self.errors
+        }
+
+
+def chunked(iterable, size):
+    """Yields lists of up to `size` items from any iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_ndjson(stream):
+    """Yields (line number, game) pairs from a stream of newline-delimited
+    JSON, one per non-blank line, as they're read. Lines that aren't
+    valid JSON come back as None, so they're rejected as invalid games.
+    """
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def import_games(games, chunk_size=1000, skip_duplicates=False):
+    """Validates and inserts games (an iterable of dicts, which can be
+    a generator) one chunk at a time, committing after each. Invalid
+    games are reported by their position in `games`.
+
+    See import_numbered_games for how problems are handled.
+    """
+    return import_numbered_games(enumerate(games), chunk_size, skip_duplicates)
+
+
+def import_ndjson(stream, chunk_size=1000, skip_duplicates=False):
+    """Like import_games, but reads games from newline-delimited JSON as
+    it streams in. Invalid games are reported by line number.
+    """
+    return import_numbered_games(read_ndjson(stream), chunk_size, skip_duplicates)
+
+
+def import_numbered_games(numbered_games, chunk_size=1000, skip_duplicates=False):
+    """Validates and inserts games, from an iterable of (number, game)
+    pairs, one chunk at a time, committing after each.
+
+    Invalid games are rejected and reported by their number; the rest
+    of their chunk is still inserted. If a chunk can't be inserted,
+    it's rolled back and reported, and the import carries on with the
+    next. With skip_duplicates, games whose URL is already in the
+    catalog (or earlier in the same chunk) are skipped.
+
+    Returns an ImportReport.
+    """
+    schema = ActivitySchema(many=True)
+    report = ImportReport()
+
+    for chunk_number, chunk in enumerate(chunked(numbered_games, chunk_size)):
+        numbers = [number for number, _ in chunk]
+        report.chunks += 1
+
+        try:
+            validated = schema.load([game for _, game in chunk])
+        except ValidationError as error:
+            report.rejected += len(error.messages)
+            report.errors.append({
+                'chunk': chunk_number,
+                'issues': {numbers[index]: issues for index, issues in error.messages.items()}
+            })
+            validated = [game for index, game in enumerate(error.valid_data) if index not in error.messages]
+
+        rows = [_import_row(game) for game in validated]
+        if not rows:
+            continue
+
+        try:
+            inserted = _insert_chunk(rows, skip_duplicates)
+            db.session.commit()
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            current_app.logger.error(f'Could not insert chunk {chunk_number} of bulk import: {error}')
+            report.errors.append({
+                'chunk': chunk_number,
+                'message': f'Could not insert games {numbers[0]} to {numbers[-1]} into the database'
+            })
+            continue
+
+        report.inserted += len(inserted)
+        report.skipped += len(rows) - len(inserted)
+        # Core inserts skip the session events that keep these up to date:
+        random_index.add(inserted)
+        response_cache.bump_version()
+
+    return report
+
+
+def _import_row(game):
+    row = {field: game.get(field) for field in IMPORT_FIELDS}
+    for field, default in IMPORT_DEFAULTS.items():
+        if row[field] is None:
+            row[field] = default
+    if row['created_date'] is None:
+        row['created_date'] = datetime.datetime.utcnow()
+    return row
+
+
+def _insert_chunk(rows, skip_duplicates):
+    """Inserts a chunk of rows, returning (id, min_players, max_players,
+    paid) for each one inserted.
+    """
+    table = Activity.__table__
+    returning = (table.c.id, table.c.min_players, table.c.max_players, table.c.paid)
+
+    if not skip_duplicates:
+        # A batched executemany (SQLAlchemy sends multi-row VALUES):
+        result = db.session.execute(insert(table).returning(*returning), rows)
+        return result.all()
+
+    # Duplicates within the chunk are dropped here (keeping the first),
+    # then the rest go over as one VALUES list. URLs aren't unique (the
+    # same site can host several games), so rather than ON CONFLICT
+    # this checks ix_activity_url for each:
+    urls = set()
+    unique_rows = []
+    for row in rows:
+        if row['url'] not in urls:
+            urls.add(row['url'])
+            unique_rows.append(row)
+
+    columns = [table.c[field] for field in IMPORT_FIELDS]
+    incoming = values(*[column(c.name, c.type) for c in columns], name='incoming').data(
+        [tuple(row[field] for field in IMPORT_FIELDS) for row in unique_rows]
+    )
+    # (Columns that are all NULL in a chunk come back untyped, hence the casts:)
+    new_games = select(
+        *[cast(incoming.c[c.name], c.type) for c in columns]
+    ).where(
+        ~exists().where(table.c.url == incoming.c.url)
+    )
+    statement = insert(table).from_select(list(IMPORT_FIELDS), new_games).returning(*returning)
+    return db.session.execute(statement).all()
@@ -0,0 +1,388 @@
+"""Caching helpers shared across the application: a bounded in-process
+LRU, and a cache of public API responses that is invalidated whenever
+the game catalog changes (and doubles as the source of their ETags).
+"""
+
+import datetime
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+
+from src.model import Activity
+
+
+class LRUCache(object):
+    """A thread-safe, bounded least-recently-used cache. Entries can
+    optionally be given an absolute expiry time (as a UNIX timestamp),
+    after which they're treated as missing.
+
+    Besides max_entries, the cache can be bounded by max_bytes, counting
+    the size passed in with each entry. A max_entries of 0 disables the
+    cache entirely.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.stats = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return default
+
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.stats['misses'] += 1
+                self.stats['expirations'] += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def set(self, key, value, expires_at=None, size=0):
+        if self.max_entries <= 0:
+            return
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self.nbytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.stats.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+
+class MemoryBackend(object):
+    """Keeps cached responses in this process. The catalog version is
+    prefixed with an ID unique to the process, so versions from before
+    a restart are never mistaken for current ones. It also rolls over
+    every `ttl` seconds, since writes made by other processes can't
+    bump it (so, as far as Last-Modified goes, the catalog may have
+    changed then too).
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.entries = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.ttl = ttl
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._changed_at = int(time.time())
+        self._version_lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.entries.nbytes
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl):
+        self.entries.set(key, value, expires_at=time.time() + ttl, size=len(value))
+
+    def state(self):
+        """The catalog version, and when it last changed (in whole
+        seconds since the epoch).
+        """
+        period = int(time.time() // self.ttl)
+        return f'{self._boot_id}.{self._version}.{period}', max(self._changed_at, period * self.ttl)
+
+    def bump_version(self):
+        with self._version_lock:
+            self._version += 1
+            self._changed_at = next_change_time(self._changed_at)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class RedisBackend(object):
+    """Keeps cached responses (and the catalog version) in Redis, or
+    anything speaking its protocol, so they're shared between workers
+    and machines. Needs the `redis` package installed.
+
+    If Redis can't be reached (within `timeout` seconds), lookups are
+    treated as misses and nothing is cached, for `retry_after` seconds
+    before trying again. A version bump that failed is retried then.
+    """
+
+    def __init__(self, url, prefix='wswp:', timeout=0.5, retry_after=5):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.prefix = prefix
+        self.retry_after = retry_after
+        self.nbytes = 0
+        self.errors = 0
+        self._redis_error = redis.RedisError
+        # As next_change_time, but atomically:
+        self._bump = self.client.register_script("""
+            local previous = tonumber(redis.call('get', KEYS[2]) or '0')
+            redis.call('set', KEYS[2], math.max(tonumber(ARGV[1]), previous + 1))
+            return redis.call('incr', KEYS[1])
+        """)
+        self._down_until = 0
+        self._bump_pending = False
+
+    @property
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def get(self, key):
+        if not self.available:
+            return None
+        try:
+            return self.client.get(self.prefix + 'response:' + key)
+        except self._redis_error as error:
+            self._failed(error)
+            return None
+
+    def set(self, key, value, ttl):
+        if not self.available:
+            return
+        try:
+            self.client.set(self.prefix + 'response:' + key, value, ex=ttl)
+        except self._redis_error as error:
+            self._failed(error)
+            return
+        # Redis evicts on its own, so this only counts what we've written:
+        self.nbytes += len(value)
+
+    def state(self):
+        """The catalog version and when it last changed (see
+        MemoryBackend.state), or None if Redis can't be reached.
+        """
+        if not self.available or (self._bump_pending and not self.bump_version()):
+            return None
+        try:
+            version, changed_at = self.client.mget(self.prefix + 'catalog_version', self.prefix + 'catalog_changed_at')
+        except self._redis_error as error:
+            self._failed(error)
+            return None
+        return (version.decode() if version else '0'), (int(changed_at) if changed_at else None)
+
+    def bump_version(self):
+        """Returns whether the bump went through (if not, it's retried
+        before the version is next read).
+        """
+        self._bump_pending = True
+        if not self.available:
+            return False
+        try:
+            self._bump(
+                keys=[self.prefix + 'catalog_version', self.prefix + 'catalog_changed_at'], args=[int(time.time())]
+            )
+        except self._redis_error as error:
+            self._failed(error)
+            return False
+        self._bump_pending = False
+        return True
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + 'response:*'):
+            self.client.delete(key)
+        self.nbytes = 0
+
+    def _failed(self, error):
+        self.errors += 1
+        self._down_until = time.monotonic() + self.retry_after
+        current_app.logger.warning(f'Response cache unavailable, not using it for {self.retry_after}s: {error}')
+
+
+class ResponseCache(object):
+    """Caches the bodies of successful responses from public read
+    endpoints, keyed by path and (sorted) query args. Keys also include
+    the catalog version, which is bumped whenever a write to the
+    activity table commits, so bumping it invalidates everything cached
+    before.
+
+    The version is also sent as the responses' ETag (with the time it
+    was last bumped as Last-Modified), so clients revalidating with
+    If-None-Match or If-Modified-Since get a 304 without the view
+    running at all.
+
+    Decorators wrapping a cached view can set g.bypass_response_cache
+    to skip the cache for a request, or g.response_cache_max_ttl to
+    cache its response for less time (see ReplicaRouter.read_only).
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 300
+        self.stats = Counter()
+
+    def init_app(self, app):
+        backend = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+        self.stats.clear()
+
+        if backend == 'memory':
+            self.backend = MemoryBackend(
+                max_entries=app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024),
+                max_bytes=app.config.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+                ttl=self.ttl
+            )
+        elif backend == 'redis':
+            self.backend = RedisBackend(
+                app.config['RESPONSE_CACHE_URL'], timeout=app.config.get('RESPONSE_CACHE_TIMEOUT', 0.5)
+            )
+        else:
+            self.backend = None
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def version(self):
+        """The catalog version, or None if the backend is unavailable.
+        """
+        state = self.state()
+        return state and state[0]
+
+    def state(self):
+        """The catalog version and when it last changed, or None if the
+        backend is unavailable.
+        """
+        return self.backend.state() if self.enabled else ('0', None)
+
+    def bump_version(self):
+        """Marks the catalog as changed, invalidating cached responses.
+        """
+        if self.enabled:
+            self.backend.bump_version()
+
+    def key_for(self, req, version=None):
+        if version is None:
+            version = self.version()
+        args = urlencode(sorted(req.args.items(multi=True)))
+        return f'{version}:{req.path}?{args}'
+
+    def report(self):
+        """Hit ratio and size of the cache, for monitoring.
+        """
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            'backend': type(self.backend).__name__ if self.enabled else None,
+            'hits': self.stats['hits'],
+            'misses': self.stats['misses'],
+            'hit_ratio': round(self.stats['hits'] / lookups, 4) if lookups else None,
+            'unavailable': self.stats['unavailable'],
+            'bytes_cached': self.backend.nbytes if self.enabled else 0
+        }
+
+    def cached(self, view):
+        """Decorates a view so its successful JSON responses are cached,
+        and conditional requests for them are answered with a 304.
+        """
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if not self.enabled or g.get('bypass_response_cache'):
+                return view(*args, **kwargs)
+
+            state = self.state()
+            if state is None:
+                # The cache is down, so serve this as if it were off:
+                self.stats['unavailable'] += 1
+                return view(*args, **kwargs)
+            version, changed_at = state
+            etag = version
+            last_modified = None
+            if changed_at is not None:
+                last_modified = datetime.datetime.fromtimestamp(changed_at, datetime.timezone.utc)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                self.stats['not_modified'] += 1
+                response = current_app.response_class(status=304)
+                return self._validated(response, etag, last_modified)
+
+            key = self.key_for(request, version)
+            body = self.backend.get(key)
+            if body is not None:
+                self.stats['hits'] += 1
+                response = current_app.response_class(body, mimetype='application/json')
+                response.headers['X-Cache'] = 'HIT'
+                return self._validated(response, etag, last_modified)
+
+            self.stats['misses'] += 1
+            response = current_app.make_response(view(*args, **kwargs))
+            response.headers['X-Cache'] = 'MISS'
+            if response.status_code != 200 or response.mimetype != 'application/json':
+                return response
+            self.backend.set(key, response.get_data(), min(self.ttl, g.get('response_cache_max_ttl', self.ttl)))
+            return self._validated(response, etag, last_modified)
+        return decorated
+
+    def _validated(self, response, etag, last_modified):
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        return response
+
+
+response_cache = ResponseCache()
+
+
+def next_change_time(previous):
+    """When the catalog changed, for Last-Modified: now, in whole
+    seconds (as HTTP dates have them), but always after the previous
+    change, so a change never goes unnoticed by clients revalidating
+    with If-Modified-Since.
+    """
+    return max(int(time.time()), previous + 1)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_catalog_changes(session, flush_context):
+    """Flags the transaction if it wrote to the activity table, so the
+    catalog version is bumped once (and only if) it commits.
+    """
+    written = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(obj, Activity) for obj in written):
+        session.info['catalog_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_catalog_version(session):
+    if session.info.pop('catalog_changed', False):
+        response_cache.bump_version()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_catalog_changes(session, previous_transaction):
+    session.info.pop('catalog_changed', None)
@@ -2,29 +2,36 @@
 the backend remotely.
 """
 
+import time
+
 import click
 import sqlalchemy
-from flask import Blueprint
+from flask import Blueprint, current_app
 
-from seed import seed_game_entries
-from src.model import Activity
 from src.database import db
+from src.backup import COMPRESSIONS, backup_tables, decompressed_reader, read_manifest, storage_for, verify_backup
+from src.restore import restore_games
+from src.seeding import seed_games, synthesize_games
+from src.selection import random_index
+from src.cache import response_cache
 
 cli_bp = Blueprint('admin', __name__)
 
 
 @cli_bp.cli.command('seed-db')
-def seed_db():
-    """Seeds game tables with data.
+@click.option('--scale', default=0, help='Also generate this many synthetic games (for load testing)')
+def seed_db(scale):
+    """Seeds game tables with data. Games already there (by URL) are
+    skipped, so this can be run again safely.
     """
-    game_entries = seed_game_entries()
-
-    for game in game_entries.get('games'):
-        activity = Activity(**game)
-        db.session.add(activity)
+    report = seed_games()
+    click.echo(f"Games tables seeded ({report.inserted} added, {report.skipped} already there).")
 
-    click.echo("Games tables seeded.")
-    db.session.commit()
+    if scale:
+        added, seconds = synthesize_games(db.engine, scale)
+        random_index.invalidate()
+        response_cache.bump_version()
+        click.echo(f"Generated {added} synthetic games in {seconds:.1f}s.")
 
 
 @cli_bp.cli.command('clear-db')
@@ -38,7 +45,10 @@ def clear_db():
             delete from activity;
             """
         )
-        db.engine.execute(text)
+        with db.engine.begin() as connection:
+            connection.execute(text)
+        random_index.invalidate()
+        response_cache.bump_version()
 
         click.echo("Database cleared.")
 
@@ -49,17 +59,88 @@ def create_test_db():
     """
 
     text = sqlalchemy.text("create database wswp_test;")
-    connection = db.engine.connect()
-    connection.execute(sqlalchemy.text("commit;"))
-    connection.execute(text)
-    connection.close()
+    # Databases can't be created inside a transaction:
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text)
 
     print("Database created")
 
 
 @cli_bp.cli.command('backup-games')
-def backup_games():
-    """Creates a time-stamped JSON file of game and category tables,
-    and pushes it to remote storage.
+@click.option('--target', default=None, help='Local directory or s3://bucket/prefix (defaults to BACKUP_TARGET)')
+@click.option('--compression', type=click.Choice(list(COMPRESSIONS)), default='gzip', show_default=True)
+@click.option('--include-submissions', is_flag=True, help='Back up the submissions table too')
+def backup_games(target, compression, include_submissions):
+    """Creates a time-stamped, compressed NDJSON backup of the games
+    table (and optionally submissions), with a manifest of row counts
+    and checksums, and pushes it to local or remote storage.
     """
-    pass
+    storage = storage_for(
+        target or current_app.config['BACKUP_TARGET'],
+        s3_endpoint_url=current_app.config['BACKUP_S3_ENDPOINT_URL']
+    )
+    tables = ('activity', 'submissions') if include_submissions else ('activity',)
+
+    start = time.perf_counter()
+    manifest = backup_tables(storage, tables=tables, compression=compression)
+    elapsed = time.perf_counter() - start
+
+    for table, entry in manifest['tables'].items():
+        click.echo(f"{table}: {entry['rows']} rows, {entry['bytes']} bytes (sha256 {entry['sha256']})")
+    click.echo(f"Backed up to {storage}/{manifest['name']} in {elapsed:.1f}s")
+
+
+@cli_bp.cli.command('restore-games')
+@click.argument('source')
+@click.option('--backup', is_flag=True, help='SOURCE names a backup folder made by backup-games, under --target')
+@click.option('--target', default=None, help='Where to find backups (defaults to BACKUP_TARGET)')
+@click.option('--chunk-size', default=10000, show_default=True, help='Games loaded per COPY')
+@click.option('--workers', default=4, show_default=True, help='Connections loading chunks in parallel')
+@click.option('--keep-indexes', is_flag=True, help="Don't drop indexes during the load (slower, but safe on a live table)")
+@click.option('--truncate', is_flag=True, help='Delete every game before restoring')
+def restore_games_command(source, backup, target, chunk_size, workers, keep_indexes, truncate):
+    """Loads games from a (possibly gzip or zstd-compressed) NDJSON dump,
+    in parallel chunks with COPY. Indexes are dropped for the load and
+    rebuilt at the end, so this is meant for a database that isn't
+    serving traffic.
+    """
+    if truncate and not click.confirm("WARNING: This will delete ALL game data before restoring. Continue?"):
+        return
+
+    if backup:
+        storage = storage_for(
+            target or current_app.config['BACKUP_TARGET'],
+            s3_endpoint_url=current_app.config['BACKUP_S3_ENDPOINT_URL']
+        )
+        problems = verify_backup(storage, source)
+        if problems:
+            raise click.ClickException('; '.join(problems))
+        manifest = read_manifest(storage, source)
+        opened = storage.open_read(f"{source}/{manifest['tables']['activity']['file']}")
+        compression = manifest['compression']
+    else:
+        opened = open(source, 'rb')
+        compression = next((name for name, ext in COMPRESSIONS.items() if source.endswith(ext)), None)
+
+    if truncate:
+        with db.engine.begin() as connection:
+            connection.execute(sqlalchemy.text('truncate activity restart identity'))
+
+    with opened as file:
+        report = restore_games(
+            db.engine, decompressed_reader(file, compression),
+            chunk_size=chunk_size, workers=workers, rebuild_indexes=not keep_indexes
+        )
+
+    random_index.invalidate()
+    response_cache.bump_version()
+
+    for error in report.errors:
+        click.echo(f'Error: {error}', err=True)
+    click.echo(
+        f'Restored {report.rows} games in {report.chunks} chunks: loaded in {report.load_seconds:.1f}s, '
+        f'indexes rebuilt in {report.index_seconds:.1f}s ({report.seconds:.1f}s total, '
+        f'{report.rows_per_second} rows/s)'
+    )
+    if report.errors:
+        raise click.ClickException(f'{len(report.errors)} problems during restore')
@@ -9,7 +9,108 @@ class Config(object):
     """
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool, per worker: DB_POOL_SIZE connections are kept
+    # open, with up to DB_MAX_OVERFLOW more under load. Checkouts wait
+    # up to DB_POOL_TIMEOUT seconds for a free connection. Connections
+    # are replaced after DB_POOL_RECYCLE seconds (-1 for never), and
+    # tested before use with DB_POOL_PRE_PING:
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = bool(int(os.getenv('DB_POOL_PRE_PING', 1)))
+    # Statements running longer than this are cancelled (0 for no limit):
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+    # Set when connecting through PgBouncer in transaction pooling mode,
+    # so nothing relies on session state (startup options, prepared
+    # statements) surviving between transactions:
+    DB_PGBOUNCER = bool(int(os.getenv('DB_PGBOUNCER', 0)))
+
+    # Read replicas (comma-separated URLs) for the public read endpoints.
+    # Replicas are checked every REPLICA_CHECK_INTERVAL seconds and
+    # skipped when they lag more than REPLICA_MAX_LAG_SECONDS, or for
+    # REPLICA_RETRY_SECONDS when they're down. Clients read from the
+    # primary for READ_AFTER_WRITE_SECONDS after writing:
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 10))
+    REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 5))
+    REPLICA_RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS', 30))
+    READ_AFTER_WRITE_SECONDS = int(os.getenv('READ_AFTER_WRITE_SECONDS', 10))
+
+    # Under the ASGI app (src.asgi), requests that aren't served async
+    # share a pool of this many threads per worker:
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', 8))
+    # Request bodies over this many bytes are refused with a 413 (unset,
+    # there's no limit, so bulk imports can be as big as they need):
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 0)) or None
     ADMIN_OFF = bool(int(os.getenv('ADMIN_OFF', 0)))
+    # Rate limit counters are kept in RATELIMIT_STORAGE_URI: in-process
+    # by default (up to RATELIMIT_MEMORY_MAX_KEYS counters, one per client
+    # and limit, and RATELIMIT_MEMORY_MAX_HITS hits remembered for moving
+    # windows), or in Redis
+    # or memcached (redis://..., memcached://...) to share them between
+    # workers, falling back to in-process counters while that's down.
+    # RATELIMIT_STRATEGY can be fixed-window or moving-window:
+    RATELIMIT_ENABLED = bool(int(os.getenv('RATELIMIT_ENABLED', 1)))
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'bounded-memory://')
+    RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'fixed-window')
+    RATELIMIT_MEMORY_MAX_KEYS = int(os.getenv('RATELIMIT_MEMORY_MAX_KEYS', 100000))
+    RATELIMIT_MEMORY_MAX_HITS = int(os.getenv('RATELIMIT_MEMORY_MAX_HITS', 1000000))
+    RATELIMIT_IN_MEMORY_FALLBACK_ENABLED = True
+    RATELIMIT_KEY_PREFIX = 'wswp'
+    # Number of proxies (load balancers) in front of the app, whose
+    # X-Forwarded-For/-Proto headers are trusted for the client's
+    # address (which rate limits are counted against):
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+
+    # Signing keys for admin tokens are cached in-process. JWKS_URL
+    # defaults to the JWKS published under AUTH0_DOMAIN:
+    JWKS_URL = os.getenv('JWKS_URL')
+    JWKS_CACHE_TTL = int(os.getenv('JWKS_CACHE_TTL', 600))
+    JWKS_MISS_COOLDOWN = int(os.getenv('JWKS_MISS_COOLDOWN', 30))
+    # Number of verified tokens to keep around (0 turns this off):
+    AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 256))
+
+    # Random game picks come from an in-process index covering parties
+    # of up to RANDOM_INDEX_MAX_PLAYERS, fully rebuilt every
+    # RANDOM_INDEX_TTL seconds:
+    RANDOM_INDEX_ENABLED = bool(int(os.getenv('RANDOM_INDEX_ENABLED', 1)))
+    RANDOM_INDEX_MAX_PLAYERS = int(os.getenv('RANDOM_INDEX_MAX_PLAYERS', 20))
+    RANDOM_INDEX_TTL = int(os.getenv('RANDOM_INDEX_TTL', 300))
+
+    # Responses from public read endpoints are cached until games are
+    # added (or RESPONSE_CACHE_TTL seconds pass). The backend can be
+    # 'memory' (per process), 'redis' (shared, see RESPONSE_CACHE_URL)
+    # or 'none':
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL')
+    # Seconds to wait on Redis before serving uncached:
+    RESPONSE_CACHE_TIMEOUT = float(os.getenv('RESPONSE_CACHE_TIMEOUT', 0.5))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+    # Bulk imports are validated and committed this many games at a time:
+    BULK_IMPORT_CHUNK_SIZE = int(os.getenv('BULK_IMPORT_CHUNK_SIZE', 1000))
+
+    # Where `flask admin backup-games` writes to: a local directory, or
+    # s3://bucket/prefix (BACKUP_S3_ENDPOINT_URL points at S3-compatible
+    # services other than AWS):
+    BACKUP_TARGET = os.getenv('BACKUP_TARGET', 'backups')
+    BACKUP_S3_ENDPOINT_URL = os.getenv('BACKUP_S3_ENDPOINT_URL')
+
+    # SQL statements are counted and timed per request (reported in a
+    # Server-Timing header). Statements slower than SLOW_QUERY_MS, or run
+    # N_PLUS_ONE_THRESHOLD times in one request, are logged:
+    QUERY_INSTRUMENTATION = bool(int(os.getenv('QUERY_INSTRUMENTATION', 1)))
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 200))
+    N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+
+    # Prometheus metrics are served at /metrics (under gunicorn, set
+    # PROMETHEUS_MULTIPROC_DIR to add up every worker's, as
+    # gunicorn.conf.py does):
+    METRICS_ENABLED = bool(int(os.getenv('METRICS_ENABLED', 1)))
 
 
 class DevConfig(Config):
@@ -1,6 +1,62 @@
+from flask import has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class RoutingSession(Session):
+    """A session that can send reads to a read replica: when a replica
+    engine is put in `info['replica']` (see src.replicas), queries go to
+    it, while flushes and insert/update/delete statements still go to
+    the primary.
+
+    Requests served by the ASGI app (see src.asgi) also put a mapping of
+    engines to their asyncpg twins in `info['async_engines']`, and
+    whichever engine is picked is swapped for its twin.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and bind is None and not self._flushing and not isinstance(clause, UpdateBase):
+            engine = replica
+        else:
+            engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        async_engines = self.info.get('async_engines')
+        return async_engines.get(engine, engine) if async_engines else engine
+
+
+def current_engine(engine):
+    """The engine to actually use for `engine` in this request: its
+    asyncpg twin when serving it from the ASGI app.
+    """
+    async_engines = db.session.info.get('async_engines') if has_app_context() else None
+    return async_engines.get(engine, engine) if async_engines else engine
+
 
 # This is initially blank -- in the main application factory,
 # it's bound to our Flask application.
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def engine_options(config, poolclass=QueuePool):
+    """Builds SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings.
+
+    Statement timeouts are normally sent as a connection startup
+    option. PgBouncer refuses unknown startup options, so in
+    DB_PGBOUNCER mode the timeout has to be set on the database role
+    instead (`alter role ... set statement_timeout`), which PgBouncer's
+    server connections pick up.
+    """
+    options = {
+        'poolclass': poolclass,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if config['DB_STATEMENT_TIMEOUT_MS'] and not config['DB_PGBOUNCER']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
\ No newline at end of file
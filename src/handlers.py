@@ -3,6 +3,8 @@
 
 from flask import current_app, jsonify
 
+from src.metrics import auth_failures
+
 
 def handle_validation_error(error):
     """Handles validation errors raised by Marshmallow
@@ -40,5 +42,6 @@ def handle_invalid_usage(error):
 def handle_auth_error(error):
     """Handles auth failures when attempting to use any of the private endpoints.
     """
+    auth_failures.labels(error.status_code).inc()
 
     return jsonify(message=error.error), error.status_code
\ No newline at end of file
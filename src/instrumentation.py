@@ -0,0 +1,138 @@
+"""Per-request SQL instrumentation: how many statements a request ran,
+how long they took in total and which was slowest (statements that
+fail, say on hitting the statement timeout, count too). This is
+reported in a Server-Timing header on every response, and slow
+statements (or the
+same statement run many times over, a sign of an N+1 pattern) are
+logged. Recording a statement costs a couple of clock reads and a dict
+update, so this is meant to stay on in production.
+"""
+
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryStats(object):
+    """Statements run while handling one request.
+    """
+
+    __slots__ = ('started', 'count', 'failed', 'seconds', 'slowest', 'slowest_seconds', 'slowest_failed',
+                 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.slowest = None
+        self.slowest_seconds = 0.0
+        self.slowest_failed = False
+        self.statements = Counter()
+
+    def record(self, statement, seconds, failed=False):
+        self.count += 1
+        self.failed += failed
+        self.seconds += seconds
+        self.statements[statement] += 1
+        if seconds > self.slowest_seconds:
+            self.slowest, self.slowest_seconds, self.slowest_failed = statement, seconds, failed
+
+    def most_repeated(self):
+        """Returns the statement run the most times, and how many times
+        (or (None, 0) if nothing ran).
+        """
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+class QueryInstrumentation(object):
+    """Hooks SQLAlchemy's cursor events up to per-request QueryStats.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.slow_query_ms = 200
+        self.n_plus_one_threshold = 10
+
+    def init_app(self, app):
+        self.enabled = app.config.get('QUERY_INSTRUMENTATION', self.enabled)
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', self.slow_query_ms)
+        self.n_plus_one_threshold = app.config.get('N_PLUS_ONE_THRESHOLD', self.n_plus_one_threshold)
+        if not self.enabled:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        # Listening on the Engine class covers every engine, including
+        # ones created after this:
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+    def _start_request(self):
+        if self.enabled:
+            g.query_stats = QueryStats()
+
+    def _finish_request(self, response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        description = f'{stats.count} queries' + (f', {stats.failed} failed' if stats.failed else '')
+        response.headers.add('Server-Timing', f'db;dur={stats.seconds * 1000:.1f};desc="{description}"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+        where = f'{request.method} {request.path}'
+        if stats.slowest_seconds * 1000 >= self.slow_query_ms:
+            failed = ', failed' if stats.slowest_failed else ''
+            current_app.logger.warning(
+                f'Slow query ({stats.slowest_seconds * 1000:.1f}ms{failed}) in {where}: {_shorten(stats.slowest)}'
+            )
+        statement, times = stats.most_repeated()
+        if times >= self.n_plus_one_threshold:
+            current_app.logger.warning(
+                f'Possible N+1 in {where}: the same statement ran {times} times: {_shorten(statement)}'
+            )
+        current_app.logger.debug(
+            f'{where}: {stats.count} queries in {stats.seconds * 1000:.1f}ms ({total_ms:.1f}ms total)'
+        )
+        return response
+
+
+query_instrumentation = QueryInstrumentation()
+
+
+# Start times are kept on each statement's execution context, which
+# goes away with it (whether it succeeds or fails):
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record(context, statement)
+
+
+def _handle_error(exception_context):
+    _record(exception_context.execution_context, exception_context.statement, failed=True)
+
+
+def _record(context, statement, failed=False):
+    started = getattr(context, 'query_started', None)
+    if started is None or not has_request_context():
+        return
+    stats = g.get('query_stats')
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - started, failed)
+
+
+def _shorten(statement, length=500):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= length else statement[:length] + '...'
@@ -0,0 +1,112 @@
+"""Process-wide cache of the JSON Web Key Set published by Auth0.
+Keys are fetched once, turned into ready-to-use RSA key objects and
+looked up by `kid` on every authenticated request, instead of hitting
+the identity provider each time.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+
+
+class JWKSCache(object):
+    """Caches signing keys from a JWKS endpoint, keyed by `kid`.
+
+    - Keys are refreshed once `ttl` seconds have passed since the last
+      successful fetch (stale keys keep being served if a refresh fails).
+    - An unknown `kid` triggers an immediate refresh (to pick up rotated
+      keys), unless the last fetch happened less than `miss_cooldown`
+      seconds ago -- so garbage `kid`s can't be used to hammer the IdP.
+    - Only one thread fetches at a time; any others waiting on that
+      fetch reuse its result rather than issuing their own.
+    """
+
+    def __init__(self, url=None, ttl=600, miss_cooldown=30, timeout=5):
+        self.url = url
+        self.ttl = ttl
+        self.miss_cooldown = miss_cooldown
+        self.timeout = timeout
+        self.stats = Counter()
+        self._keys = {}
+        self._fetched_at = None
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Reads cache settings from the application config and
+        drops anything cached for a previous application.
+        """
+        self.url = app.config.get('JWKS_URL')
+        self.ttl = app.config.get('JWKS_CACHE_TTL', self.ttl)
+        self.miss_cooldown = app.config.get('JWKS_MISS_COOLDOWN', self.miss_cooldown)
+        self.clear()
+
+    def clear(self):
+        with self._refresh_lock:
+            self._keys = {}
+            self._fetched_at = None
+        with self._stats_lock:
+            self.stats.clear()
+
+    @property
+    def jwks_url(self):
+        if self.url:
+            return self.url
+        return f'https://{os.getenv("AUTH0_DOMAIN")}/.well-known/jwks.json'
+
+    def get_key(self, kid):
+        """Returns the key object for a given `kid`, or None if the
+        identity provider doesn't know about it.
+        """
+        now = time.monotonic()
+        fetched_at = self._fetched_at
+        expired = fetched_at is None or now - fetched_at >= self.ttl
+
+        key = self._keys.get(kid)
+        if key is not None and not expired:
+            self._count('hits')
+            return key
+
+        self._count('misses')
+        if not expired and now - fetched_at < self.miss_cooldown:
+            # We only just refreshed and this kid still wasn't there:
+            return None
+
+        self._refresh(seen_fetch=fetched_at)
+        return self._keys.get(kid)
+
+    def _refresh(self, seen_fetch):
+        with self._refresh_lock:
+            # Somebody else refreshed while we were waiting on the lock:
+            if self._fetched_at != seen_fetch:
+                return
+
+            # Imported here, as only authenticated requests need them:
+            import requests
+            from jose import jwk
+
+            try:
+                response = requests.get(self.jwks_url, timeout=self.timeout)
+                response.raise_for_status()
+                keys = {}
+                for key in response.json()["keys"]:
+                    if key.get("kty") != "RSA" or "kid" not in key:
+                        continue
+                    keys[key["kid"]] = jwk.construct(key, "RS256")
+            except Exception:
+                self._count('refresh_failures')
+                if not self._keys:
+                    raise
+                # Keep serving the keys we already have (and don't retry
+                # on every request):
+                self._fetched_at = time.monotonic()
+                return
+
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self._count('refreshes')
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
@@ -0,0 +1,184 @@
+"""Prometheus metrics for the application, served at /metrics: requests
+and their latency per route, response cache lookups, rate-limited
+requests, auth failures, database connection pool usage (including
+how long checkouts wait for a connection, to size the pool by) and the
+size of the random game index.
+
+Under gunicorn, each worker writes its samples to files in the
+PROMETHEUS_MULTIPROC_DIR directory (see gunicorn.conf.py), and these are
+added up when /metrics is scraped, so whichever worker answers reports
+for all of them. Without that variable, only this process is reported.
+"""
+
+import os
+import time
+
+from flask import Blueprint, Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+from src.database import db
+
+metrics_bp = Blueprint('metrics', __name__)
+
+http_requests = Counter(
+    'wswp_http_requests', 'HTTP requests handled', ['method', 'route', 'status']
+)
+http_request_duration = Histogram(
+    'wswp_http_request_duration_seconds', 'Time taken to handle HTTP requests', ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+response_cache_lookups = Counter(
+    'wswp_response_cache_lookups', 'Response cache lookups, by result (hit, miss or not_modified)',
+    ['route', 'result']
+)
+rate_limited_requests = Counter(
+    'wswp_rate_limited_requests', 'Requests rejected for going over a rate limit', ['route']
+)
+auth_failures = Counter(
+    'wswp_auth_failures', 'Requests to private endpoints failing authentication', ['status']
+)
+db_pool_checkouts = Counter(
+    'wswp_db_pool_checkouts', 'Connections checked out of the database pool', ['engine']
+)
+db_pool_checked_out = Gauge(
+    'wswp_db_pool_checked_out', 'Connections currently checked out of the database pool', ['engine'],
+    multiprocess_mode='livesum'
+)
+db_pool_overflow = Gauge(
+    'wswp_db_pool_overflow', 'Connections currently open beyond the pool size', ['engine'],
+    multiprocess_mode='livesum'
+)
+db_pool_checkout_wait = Histogram(
+    'wswp_db_pool_checkout_wait_seconds', 'Time taken to check a connection out of the database pool',
+    ['engine'], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+db_pool_timeouts = Counter(
+    'wswp_db_pool_timeouts', 'Checkouts that gave up waiting for a database connection', ['engine']
+)
+replica_routing = Counter(
+    'wswp_replica_routing', 'Read-only requests, by where their reads went', ['target']
+)
+random_index_ids = Gauge(
+    'wswp_random_index_ids', 'Game IDs held in the random game index', multiprocess_mode='livemax'
+)
+random_index_bytes = Gauge(
+    'wswp_random_index_bytes', 'Approximate memory held by the random game index', multiprocess_mode='livemax'
+)
+random_index_rebuild_seconds = Gauge(
+    'wswp_random_index_rebuild_seconds', 'Time taken by the last rebuild of the random game index',
+    multiprocess_mode='livemax'
+)
+random_index_rebuilds = Counter(
+    'wswp_random_index_rebuilds', 'Full rebuilds of the random game index'
+)
+db_replica_lag = Gauge(
+    'wswp_db_replica_lag_seconds', 'How far behind the primary read replicas were when last checked',
+    ['engine'], multiprocess_mode='max'
+)
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool recording how long each checkout takes (waiting for a
+    free connection, opening a new one or pinging it), and how many time
+    out. Timings are labelled with `label`, which Metrics sets to the
+    engine's bind key.
+    """
+
+    label = 'default'
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            db_pool_timeouts.labels(self.label).inc()
+            raise
+        finally:
+            db_pool_checkout_wait.labels(self.label).observe(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.label = self.label
+        return pool
+
+
+class Metrics(object):
+    """Records request and database pool metrics for an application.
+    """
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+        with app.app_context():
+            for bind_key, engine in db.engines.items():
+                self.watch_engine(engine, bind_key or 'default')
+
+    def _start_request(self):
+        g.request_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        route = current_route()
+        http_requests.labels(request.method, route, response.status_code).inc()
+        started = g.get('request_started')
+        if started is not None:
+            http_request_duration.labels(request.method, route).observe(time.perf_counter() - started)
+
+        # Only cached views answer with a 304 or an X-Cache header:
+        if response.status_code == 304:
+            response_cache_lookups.labels(route, 'not_modified').inc()
+        elif 'X-Cache' in response.headers:
+            response_cache_lookups.labels(route, response.headers['X-Cache'].lower()).inc()
+        return response
+
+    def watch_engine(self, engine, name):
+        """Records checkouts from an engine's pool under `name`.
+        """
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.label = name
+        checkouts = db_pool_checkouts.labels(name)
+        checked_out = db_pool_checked_out.labels(name)
+        overflow = db_pool_overflow.labels(name)
+
+        def update(*args):
+            # The engine's pool is replaced if it's disposed of (keeping
+            # these listeners). Other pool classes don't keep count:
+            pool = engine.pool
+            if isinstance(pool, QueuePool):
+                checked_out.set(pool.checkedout())
+                overflow.set(max(pool.overflow(), 0))
+
+        def count_checkout(*args):
+            checkouts.inc()
+            update()
+
+        event.listen(engine.pool, 'checkout', count_checkout)
+        event.listen(engine.pool, 'checkin', update)
+
+
+metrics = Metrics()
+
+
+def current_route():
+    """The URL rule that matched the current request (so that, say,
+    every game ID counts towards /v1/games/<int:id>).
+    """
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def record_rate_limit(request_limit):
+    """Passed to the limiter as its on_breach callback.
+    """
+    rate_limited_requests.labels(current_route()).inc()
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def expose_metrics():
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
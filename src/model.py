@@ -4,12 +4,21 @@ Module containing all database table definitions.
 
 import datetime, math
 from src.database import db
-from sqlalchemy.dialects.postgresql import TEXT
-from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import TEXT, TSVECTOR
+from sqlalchemy import func, text, select, cast, and_, or_, BigInteger
+from sqlalchemy.orm import deferred
 from collections import namedtuple
+from markupsafe import escape
 
 paginated_results = namedtuple('PaginatedSearchResults', ['results', 'page', 'next_page', 'total_pages'])
 
+# Game fields exposed through the API (see ActivitySchema):
+ACTIVITY_FIELDS = (
+    'id', 'name', 'url', 'description', 'paid', 'min_players',
+    'max_players', 'created_date', 'submitted_by'
+)
+
+
 class Activity(db.Model):
     """Represents an activity (i.e. a game)
     """
@@ -26,54 +35,166 @@ class Activity(db.Model):
     created_date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     submitted_by = db.Column(db.String(256), nullable=True)
 
+    # Full-text search document, maintained by Postgres. Names are weighted
+    # above descriptions. Deferred so regular queries don't load it:
+    search_vector = deferred(db.Column(
+        TSVECTOR,
+        db.Computed(
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+            persisted=True
+        )
+    ))
+
+    __table_args__ = (
+        db.Index('ix_activity_search_vector', 'search_vector', postgresql_using='gin'),
+        # Serves the newest-first listing and cursor pagination on /games:
+        db.Index('ix_activity_created_date_id', 'created_date', 'id'),
+        # ... and the same, filtered down to free or paid games:
+        db.Index('ix_activity_paid_created_date_id', 'paid', 'created_date', 'id'),
+        # Lets random picks count and skip through eligible games
+        # without touching the table:
+        db.Index('ix_activity_players', 'min_players', 'max_players', 'paid', postgresql_include=['id']),
+        # Lets bulk imports skip games already in the catalog by URL:
+        db.Index('ix_activity_url', 'url'),
+    )
+
     @classmethod
-    def search(cls, search_term, page=1, per_page=25):
-        """Queries Activity objects whose name / description
+    def search(cls, search_term, page=1, per_page=25, headlines=False):
+        """Queries Activity rows whose name / description
         match a certain search_term, applying pagination as adjusted by
         the page and per_page parameters (uses PostgreSQL full-text
-        search under the hood)
+        search under the hood, against the GIN-indexed search_vector)
+
+        The total number of matches and the requested page are fetched
+        in a single statement. Results are rows holding the public
+        game fields (see ACTIVITY_FIELDS) rather than ORM objects, ordered
+        by relevance (ties broken by ID, so pages are stable). If headlines
+        is set, each row also has a `headline` snippet of its description.
 
         Returns a NamedTuple, containing the results (list), current page,
         next page, and total number of pages. 
         """
 
-        # Check to see the total number of results for our search
-        all_results_count = """
-                select count(1)
-                from activity
-                where to_tsvector(name || ' ' || coalesce(description, '')) @@ plainto_tsquery(:searchparam)
-        """
-        with db.engine.connect() as connection:
-            number_of_records = connection.execute(text(all_results_count).bindparams(searchparam=search_term)).fetchone()[0]
+        query = SEARCH_QUERY_WITH_HEADLINES if headlines else SEARCH_QUERY
+        rows = db.session.execute(query, {
+            'searchparam': search_term,
+            'limit': per_page,
+            'offset': (page - 1) * per_page
+        }).all()
+
+        # Every row carries the total. If the page is past the end of our
+        # results, we get back a single row with only the total filled in:
+        number_of_records = rows[0].total if rows else 0
+        results = [row for row in rows if row.id is not None]
 
         # If we don't have any results off the bat, don't even bother paginating:
         if number_of_records < 1:
             return paginated_results([], 1, None, 1)
 
-        # Otherwise, paginate!
-        if (number_of_records / per_page) < 1:
-            total_pages = 1
-        else:
-            total_pages = 1 + math.floor(number_of_records / per_page)
-        
-        # These will be used in our SQL query:
-        limit = per_page
-        offset = (page - 1) * per_page
-
-        if (page + 1) > total_pages:
-            next_page = None
-        else:
-            next_page = page + 1 
-
-        results = db.session.query(cls).from_statement(text(
-            """select * 
+        total_pages = math.ceil(number_of_records / per_page)
+        next_page = page + 1 if page < total_pages else None
+
+        return paginated_results(results, page, next_page, total_pages)
+
+    @classmethod
+    def eligible_for(cls, players, free_only=False):
+        """Filter for games that can be played by a party of `players`
+        (max_players can be null when a game takes practically any
+        number of players), optionally only free ones.
+        """
+        criteria = and_(
+            cls.min_players <= players,
+            or_(cls.max_players >= players, cls.max_players.is_(None))
+        )
+        if free_only:
+            criteria = and_(criteria, cls.paid == False)
+        return criteria
+
+    @classmethod
+    def random(cls, players, free_only=False):
+        """Picks a game uniformly at random out of those a party of
+        `players` can play, returning a row of its public fields (or
+        None if nothing fits).
+
+        This is a single statement: Postgres counts the eligible games and
+        skips a random number of them, so no ORM objects (or lists of IDs)
+        are built up on our side.
+        """
+        eligible = cls.eligible_for(players, free_only)
+        number_eligible = select(func.count()).select_from(cls).where(eligible).scalar_subquery()
+
+        # Skipping through IDs alone can be done with an index-only scan;
+        # only the game we land on is read from the table:
+        picked_id = select(cls.id).where(eligible).offset(
+            cast(func.floor(func.random() * number_eligible), BigInteger)
+        ).limit(1).scalar_subquery()
+
+        statement = select(*cls.public_columns()).where(cls.id == picked_id)
+
+        return db.session.execute(statement).first()
+
+    @classmethod
+    def get_public(cls, id):
+        """Fetches a row of a game's public fields by ID (or None).
+        """
+        statement = select(*cls.public_columns()).where(cls.id == id)
+        return db.session.execute(statement).first()
+
+    @classmethod
+    def public_columns(cls):
+        """The table columns exposed through the API, in order.
+        """
+        return [cls.__table__.c[field] for field in ACTIVITY_FIELDS]
+
+
+# Markers ts_headline wraps matching words in. They're swapped for <mark>
+# tags once the rest of the snippet has been HTML-escaped:
+HEADLINE_START, HEADLINE_STOP = '\x02', '\x03'
+
+
+def search_query(headlines=False):
+    """Builds the statement behind Activity.search. It counts every match
+    and pulls one page of them (ranked, title matches first) in the same
+    round trip -- the lateral join still returns the total when the page
+    is empty. Headlines are only built for rows on the page.
+    """
+    headline = ""
+    if headlines:
+        headline = (
+            ", ts_headline('english', coalesce(page.description, ''), query, "
+            f"'StartSel={HEADLINE_START}, StopSel={HEADLINE_STOP}, MaxFragments=2, MaxWords=30, MinWords=10') as headline"
+        )
+
+    return text(f"""
+        select matches.total, page.*{headline}
+        from plainto_tsquery('english', :searchparam) query
+        cross join lateral (
+            select count(1) as total
             from activity
-            where to_tsvector(name || ' ' || coalesce(description, '')) @@ plainto_tsquery(:searchparam)
+            where search_vector @@ query
+        ) matches
+        left join lateral (
+            select {', '.join(ACTIVITY_FIELDS)}
+            from activity
+            where search_vector @@ query
+            order by ts_rank_cd('{{0.1, 0.2, 0.4, 1.0}}', search_vector, query) desc, id
             limit :limit offset :offset
-            """
-        )).params(searchparam=search_term, limit=limit, offset=offset).all()
-        
-        return paginated_results(results, page, next_page, total_pages)
+        ) page on true
+    """)
+
+
+SEARCH_QUERY = search_query()
+SEARCH_QUERY_WITH_HEADLINES = search_query(headlines=True)
+
+
+def render_headline(headline):
+    """Turns a headline from the search query into HTML-safe markup,
+    with matching words wrapped in <mark> tags.
+    """
+    if headline is None:
+        return None
+    return str(escape(headline)).replace(HEADLINE_START, '<mark>').replace(HEADLINE_STOP, '</mark>')
 
 
 class Submission(db.Model):
@@ -92,4 +213,23 @@ class Submission(db.Model):
     created_date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     submitted_by = db.Column(db.String(256), nullable=True)
     approved = db.Column(db.Boolean, nullable=False, default=False)
-    archived = db.Column(db.Boolean, nullable=False, default=False)
\ No newline at end of file
+    archived = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        # Only covers the (small) queue of submissions waiting on review:
+        db.Index(
+            'ix_submissions_pending', 'created_date',
+            postgresql_where=text('NOT archived AND NOT approved')
+        ),
+    )
+
+    @classmethod
+    def pending(cls):
+        """Query for submissions that haven't been approved or archived
+        yet, newest first. Written so Postgres can match it against the
+        partial ix_submissions_pending index.
+        """
+        return cls.query.filter(
+            cls.archived == False,
+            cls.approved == False
+        ).order_by(cls.created_date.desc())
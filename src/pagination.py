@@ -0,0 +1,51 @@
+"""Helpers for cursor-based (keyset) pagination. A cursor is an opaque,
+URL-safe token pointing just past the last game a client has seen.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+
+from sqlalchemy import and_, or_, tuple_
+
+from src.exceptions import InvalidUsage
+
+
+def encode_cursor(created_date, id):
+    """Encodes the sort key of a game (its creation date and ID) as an
+    opaque cursor.
+    """
+    sort_key = [created_date.isoformat() if created_date else None, id]
+    raw = json.dumps(sort_key, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor made by encode_cursor back into a
+    (created_date, id) tuple. Raises InvalidUsage if it's malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_date, id = json.loads(raw)
+        if created_date is not None:
+            created_date = datetime.datetime.fromisoformat(created_date)
+        if not isinstance(id, int):
+            raise ValueError
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidUsage('cursor is invalid (use a next_cursor returned by the API)')
+
+    return created_date, id
+
+
+def after_cursor(model, created_date, id):
+    """Returns a filter for rows after a cursor, when ordering by
+    created_date desc, id desc (Postgres sorts NULL dates first here).
+    The row comparison lets Postgres walk the (created_date, id) index.
+    """
+    if created_date is None:
+        return or_(
+            and_(model.created_date.is_(None), model.id < id),
+            model.created_date.isnot(None)
+        )
+    return tuple_(model.created_date, model.id) < (created_date, id)
@@ -0,0 +1,157 @@
+"""Storage for rate limit counters. With several workers (or machines),
+counters belong in Redis or memcached (RATELIMIT_STORAGE_URI) so every
+worker sees the same ones, with in-process counters standing in while
+that storage is unreachable.
+
+In-process counters are kept in BoundedMemoryStorage. Unlike limits'
+MemoryStorage, it holds at most `max_keys` keys (evicting the least
+recently used), and expires them lazily instead of sweeping every key
+from a timer thread, so memory and overhead don't grow with the number
+of clients. Each key is one client's count against one limit, so a
+client hitting endpoints with different limits takes up several.
+
+The moving window strategy remembers the time of every hit in each
+key's window, so those are bounded too, by `max_hits` in total.
+"""
+
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlparse
+
+from limits.storage import MovingWindowSupport, Storage
+from limits.strategies import STRATEGIES
+
+
+class BoundedMemoryStorage(Storage, MovingWindowSupport):
+    """In-process rate limit storage for the fixed and moving window
+    strategies, registered as bounded-memory:// (which takes max_keys
+    and max_hits options, or query parameters).
+    """
+
+    STORAGE_SCHEME = ['bounded-memory']
+
+    def __init__(self, uri=None, max_keys=100000, max_hits=1000000, **options):
+        query = parse_qs(urlparse(uri).query) if uri else {}
+        self.max_keys = int(query['max_keys'][0]) if 'max_keys' in query else int(max_keys)
+        self.max_hits = int(query['max_hits'][0]) if 'max_hits' in query else int(max_hits)
+        self.evictions = 0
+        # Hit times held across every moving window:
+        self.stored_hits = 0
+        # Key -> [count, expiry time], least recently used first:
+        self._counters = OrderedDict()
+        # Key -> times of hits in the moving window, oldest first:
+        self._windows = OrderedDict()
+        super().__init__(uri, **options)
+
+    @property
+    def base_exceptions(self):
+        return ValueError
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        with self.lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[1] <= now:
+                entry = self._counters[key] = [0, now + expiry]
+                self._evict(self._counters)
+            elif elastic_expiry:
+                entry[1] = now + expiry
+            self._counters.move_to_end(key)
+            entry[0] += amount
+            return entry[0]
+
+    def get(self, key):
+        entry = self._counters.get(key)
+        return entry[0] if entry is not None and entry[1] > time.time() else 0
+
+    def get_expiry(self, key):
+        entry = self._counters.get(key)
+        now = time.time()
+        return int(entry[1] if entry is not None and entry[1] > now else now)
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+
+        now = time.time()
+        with self.lock:
+            window = self._window(key, now - expiry)
+            if len(window) + amount > limit:
+                return False
+            window.extend([now] * amount)
+            self.stored_hits += amount
+            # Drop whole windows, least recently used first, to stay
+            # under max_hits (keeping this key's):
+            while self.stored_hits > self.max_hits and len(self._windows) > 1:
+                self._drop_oldest(self._windows)
+            return True
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        with self.lock:
+            window = self._window(key, now - expiry)
+            return int(window[0] if window else now), len(window)
+
+    def check(self):
+        return True
+
+    def reset(self):
+        with self.lock:
+            count = max(len(self._counters), len(self._windows))
+            self._counters.clear()
+            self._windows.clear()
+            self.stored_hits = 0
+            return count
+
+    def clear(self, key):
+        with self.lock:
+            self._counters.pop(key, None)
+            self.stored_hits -= len(self._windows.pop(key, ()))
+
+    def _window(self, key, start):
+        """Returns a key's hits since `start`, dropping older ones.
+        """
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = deque()
+            self._evict(self._windows)
+        else:
+            self._windows.move_to_end(key)
+            while window and window[0] < start:
+                window.popleft()
+                self.stored_hits -= 1
+        return window
+
+    def _evict(self, entries):
+        while len(entries) > self.max_keys:
+            self._drop_oldest(entries)
+
+    def _drop_oldest(self, entries):
+        _, entry = entries.popitem(last=False)
+        if entries is self._windows:
+            self.stored_hits -= len(entry)
+        self.evictions += 1
+
+
+def init_limiter(limiter, app):
+    """Sets a limiter up on an app as limiter.init_app does, but keeping
+    any in-process counters (including the fallback's) in
+    BoundedMemoryStorage, holding up to RATELIMIT_MEMORY_MAX_KEYS keys
+    and RATELIMIT_MEMORY_MAX_HITS moving window hits.
+    """
+    bounds = {
+        'max_keys': app.config.get('RATELIMIT_MEMORY_MAX_KEYS', 100000),
+        'max_hits': app.config.get('RATELIMIT_MEMORY_MAX_HITS', 1000000),
+    }
+    storage_uri = app.config.get('RATELIMIT_STORAGE_URI', 'memory://')
+    if urlparse(storage_uri).scheme in BoundedMemoryStorage.STORAGE_SCHEME:
+        app.config.setdefault('RATELIMIT_STORAGE_OPTIONS', bounds)
+
+    limiter.init_app(app)
+
+    # Flask-Limiter always falls back to limits' MemoryStorage:
+    if getattr(limiter, '_fallback_storage', None) is not None:
+        limiter._fallback_storage = BoundedMemoryStorage(**bounds)
+        limiter._fallback_limiter = STRATEGIES[app.config.get('RATELIMIT_STRATEGY', 'fixed-window')](
+            limiter._fallback_storage
+        )
@@ -0,0 +1,253 @@
+"""Routing reads from the public API to read replicas. Views marked
+read_only run their queries on one of the DATABASE_REPLICA_URLS, taking
+turns, while everything else (and any write) goes to the primary.
+
+Replicas are checked every REPLICA_CHECK_INTERVAL seconds: one that
+can't be reached, or has fallen more than REPLICA_MAX_LAG_SECONDS
+behind, is skipped (for REPLICA_RETRY_SECONDS, if it's down), and reads
+fall back to the primary if none are usable. After a request commits a
+write (whatever its method), a short-lived cookie keeps that client's
+reads on the primary, so it always sees its own writes.
+
+Responses read from a replica may be behind the catalog version they'd
+be cached under, so they're cached for no longer than a replica may
+lag, and clients reading from the primary after a write skip the
+response cache altogether.
+"""
+
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from src.database import current_engine, db
+from src.metrics import db_replica_lag, replica_routing
+
+# How far behind the primary a replica is, in seconds. A replica that has
+# replayed everything it received isn't behind, however long ago that
+# was, and a server that isn't a replica at all gives null:
+LAG_QUERY = text("""
+    select case
+        when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0
+        else extract(epoch from now() - pg_last_xact_replay_timestamp())
+    end
+""")
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Replica(object):
+    """What we last found out about a replica.
+    """
+
+    def __init__(self, bind_key):
+        self.bind_key = bind_key
+        self.lag = None
+        self.checked_at = None
+        self.down_until = 0
+        self.error = None
+        # Held while checking it, so only one thread does at a time:
+        self.lock = threading.Lock()
+
+    @property
+    def engine(self):
+        return db.engines[self.bind_key]
+
+
+class ReplicaRouter(object):
+    """Picks a replica for each read-only request (see the module
+    docstring). Replica engines are Flask-SQLAlchemy binds named
+    replica_0, replica_1 and so on, so they're pooled like the primary.
+    """
+
+    def __init__(self):
+        self.replicas = []
+        self.max_lag = 10
+        self.check_interval = 5
+        self.retry_after = 30
+        self.read_after_write_seconds = 10
+        self.cookie_name = 'wswp_primary'
+        self.stats = Counter()
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Adds a bind for each replica URL. This has to run before
+        db.init_app, which creates the engines.
+        """
+        urls = app.config.get('DATABASE_REPLICA_URLS') or []
+        self.max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', self.max_lag)
+        self.check_interval = app.config.get('REPLICA_CHECK_INTERVAL', self.check_interval)
+        self.retry_after = app.config.get('REPLICA_RETRY_SECONDS', self.retry_after)
+        self.read_after_write_seconds = app.config.get('READ_AFTER_WRITE_SECONDS', self.read_after_write_seconds)
+        self.stats.clear()
+        self._next = 0
+
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        self.replicas = []
+        for number, url in enumerate(urls):
+            binds[f'replica_{number}'] = url
+            self.replicas.append(Replica(f'replica_{number}'))
+
+        if self.replicas:
+            app.after_request(self._stick_to_primary)
+            # Connections to a replica dropping also mark it down:
+            if not event.contains(Engine, 'handle_error', _on_engine_error):
+                event.listen(Engine, 'handle_error', _on_engine_error)
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def choose(self):
+        """Returns the engine of the next usable replica, or None if
+        there isn't one.
+        """
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+
+        now = time.monotonic()
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._usable(replica, now):
+                return replica.engine
+        return None
+
+    def check(self, replica):
+        """Measures a replica's lag, marking it down if it can't be
+        reached.
+        """
+        replica.checked_at = time.monotonic()
+
+        try:
+            # (Under the ASGI app, this needs to go through asyncpg too.)
+            with current_engine(replica.engine).connect() as connection:
+                replica.lag = float(replica_lag(connection) or 0)
+            replica.error = None
+            db_replica_lag.labels(replica.bind_key).set(replica.lag)
+        except SQLAlchemyError as error:
+            self.mark_down(replica, error)
+
+    def mark_down(self, replica, error):
+        replica.down_until = time.monotonic() + self.retry_after
+        replica.error = str(error)
+        current_app.logger.warning(
+            f'Read replica {replica.bind_key} is down, not using it for {self.retry_after}s: {error}'
+        )
+
+    def report(self):
+        """State of each replica and where reads went, for monitoring.
+        """
+        now = time.monotonic()
+        return {
+            'replicas': [{
+                'name': replica.bind_key,
+                'up': replica.down_until <= now,
+                'lag_seconds': replica.lag,
+                'error': replica.error,
+            } for replica in self.replicas],
+            'reads': dict(self.stats),
+        }
+
+    def read_only(self, view):
+        """Decorates a view that doesn't write, so its queries can go to
+        a replica. Clients that wrote recently still read from the
+        primary.
+        """
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if not self.enabled or request.method not in SAFE_METHODS:
+                return view(*args, **kwargs)
+
+            engine = None
+            if request.cookies.get(self.cookie_name):
+                target = 'primary_after_write'
+                g.bypass_response_cache = True
+            else:
+                engine = self.choose()
+                target = 'primary_fallback' if engine is None else 'replica'
+            self.stats[target] += 1
+            replica_routing.labels(target).inc()
+
+            if engine is None:
+                return view(*args, **kwargs)
+            db.session.info['replica'] = engine
+            g.response_cache_max_ttl = self.max_lag
+            try:
+                return view(*args, **kwargs)
+            finally:
+                db.session.info.pop('replica', None)
+        return decorated
+
+    def _usable(self, replica, now):
+        if replica.down_until > now:
+            return False
+        # If another thread is already checking it, go on what we last
+        # found out (the lag is None until the first check is done):
+        if self._due(replica, now) and replica.lock.acquire(blocking=False):
+            try:
+                if self._due(replica, now):
+                    self.check(replica)
+            finally:
+                replica.lock.release()
+        return replica.down_until <= now and replica.lag is not None and replica.lag <= self.max_lag
+
+    def _due(self, replica, now):
+        return replica.checked_at is None or now - replica.checked_at >= self.check_interval
+
+    def _on_error(self, context):
+        for replica in self.replicas:
+            # (Under the ASGI app, that may be the replica's asyncpg twin.)
+            if context.engine in (replica.engine, current_engine(replica.engine)):
+                self.mark_down(replica, context.original_exception)
+
+    def _stick_to_primary(self, response):
+        if g.get('committed_write'):
+            response.set_cookie(
+                self.cookie_name, '1', max_age=self.read_after_write_seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+replica_router = ReplicaRouter()
+
+
+def replica_lag(connection):
+    return connection.execute(LAG_QUERY).scalar()
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_writes(session, flush_context):
+    """Flags the transaction if it wrote anything, so the request that
+    commits it reads from the primary afterwards.
+    """
+    session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _note_committed_writes(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        g.committed_write = True
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_writes(session, previous_transaction):
+    session.info.pop('wrote', None)
+
+
+def _on_engine_error(context):
+    if context.is_disconnect and has_app_context():
+        replica_router._on_error(context)
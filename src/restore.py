@@ -0,0 +1,161 @@
+"""Restoring games from large NDJSON dumps (such as the ones backup-games
+writes). The dump is read in chunks, which a small pool of connections
+loads with COPY in parallel. Secondary indexes are dropped for the load
+and rebuilt once at the end, which is much cheaper than updating them
+row by row.
+"""
+
+import contextlib
+import datetime
+import io
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from sqlalchemy import text
+
+from src.bulk import IMPORT_DEFAULTS, IMPORT_FIELDS, chunked, read_ndjson
+from src.model import Activity
+
+
+class RestoreReport(object):
+    """Tally of a restore, with timings.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.chunks = 0
+        self.errors = []
+        self.load_seconds = 0
+        self.index_seconds = 0
+
+    @property
+    def seconds(self):
+        return self.load_seconds + self.index_seconds
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds) if self.seconds else None
+
+
+def copy_value(value):
+    """Formats a value for COPY's text format.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def copy_chunk(engine, games):
+    """COPYs a chunk of games (dicts) into the activity table on its own
+    connection, committing it. Games keep their IDs if every one in the
+    chunk has one. Returns how many rows were loaded.
+    """
+    columns = IMPORT_FIELDS
+    if all(game.get('id') is not None for game in games):
+        columns = ('id',) + IMPORT_FIELDS
+    defaults = dict(IMPORT_DEFAULTS, created_date=datetime.datetime.utcnow().isoformat())
+
+    data = ''.join(
+        '\t'.join(
+            copy_value(defaults.get(column) if game.get(column) is None else game[column])
+            for column in columns
+        ) + '\n'
+        for game in games
+    )
+
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"copy activity ({', '.join(columns)}) from stdin", io.BytesIO(data.encode()))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return len(games)
+
+
+@contextlib.contextmanager
+def indexes_dropped(engine, table=None, drop=True):
+    """Drops a table's secondary indexes for the duration of the block
+    (for bulk loads), then creates them again, even if the load fails.
+    Afterwards the table's ID sequence is moved past its highest ID and
+    the table is analyzed. Yields how long the rebuild took, in a list
+    filled in on the way out.
+    """
+    table = table if table is not None else Activity.__table__
+    indexes = [index for index in table.indexes if not index.unique] if drop else []
+    timing = []
+
+    with engine.begin() as connection:
+        for index in indexes:
+            connection.execute(text(f'drop index if exists {index.name}'))
+    try:
+        yield timing
+    finally:
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            for index in indexes:
+                index.create(connection)
+            connection.execute(text(
+                f"select setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"coalesce(max(id), 1), max(id) is not null) from {table.name}"
+            ))
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text(f'analyze {table.name}'))
+        timing.append(time.perf_counter() - start)
+
+
+def restore_games(engine, lines, chunk_size=10000, workers=4, rebuild_indexes=True):
+    """Loads games from an iterable of NDJSON lines (bytes or str) into
+    the activity table, `workers` chunks at a time. Each chunk commits
+    on its own; chunks that fail are reported and skipped. Afterwards,
+    the ID sequence is moved past the highest ID loaded.
+
+    With rebuild_indexes, the table's secondary indexes are dropped
+    before loading and created again at the end (even if loading
+    fails). Returns a RestoreReport.
+    """
+    report = RestoreReport()
+
+    with indexes_dropped(engine, drop=rebuild_indexes) as rebuild_timing:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            for chunk_number, chunk in enumerate(chunked(_valid_games(lines, report), chunk_size)):
+                # Only read ahead a couple of chunks per worker, so memory
+                # stays bounded however big the dump is:
+                while len(pending) >= workers * 2:
+                    _collect(pending, wait(pending, return_when=FIRST_COMPLETED).done, report)
+                games = [game for _, game in chunk]
+                future = executor.submit(copy_chunk, engine, games)
+                pending[future] = (chunk_number, chunk[0][0], chunk[-1][0])
+                report.chunks += 1
+            _collect(pending, wait(pending).done, report)
+        report.load_seconds = time.perf_counter() - start
+
+    report.index_seconds = rebuild_timing[0]
+    return report
+
+
+def _valid_games(lines, report):
+    for number, game in read_ndjson(lines):
+        if isinstance(game, dict):
+            yield number, game
+        else:
+            report.errors.append(f'Line {number} is not a JSON object')
+
+
+def _collect(pending, done, report):
+    for future in done:
+        chunk_number, first_line, last_line = pending.pop(future)
+        try:
+            report.rows += future.result()
+        except Exception as error:
+            report.errors.append(f'Chunk {chunk_number} (lines {first_line}-{last_line}): {error}')
@@ -2,18 +2,23 @@
 Blueprint containing all API resources for WSWP.
 """
 
-from flask import Blueprint, jsonify, request, current_app
+import math
+
+from flask import Blueprint, jsonify, request, current_app, abort
 from marshmallow import ValidationError
-from sqlalchemy import or_, column, text
+from sqlalchemy import or_, column, text, select
 from sqlalchemy.sql import functions
 from sqlalchemy.exc import SQLAlchemyError
-from src.model import Activity, Submission
-from src.schema import ActivitySchema, SubmissionSchema
+from src.model import Activity, Submission, render_headline
 from src.database import db
 from src.exceptions import InvalidUsage, AuthError
 from src.auth import requires_auth, limiter, cors
+from src.pagination import encode_cursor, decode_cursor, after_cursor
+from src.selection import random_index
+from src.cache import response_cache
+from src.replicas import replica_router
+from src.serializers import dump_game, dump_games, json_response
 import src.handlers as handlers
-from random import choice
 
 api = Blueprint('api', __name__)
 api.register_error_handler(ValidationError, handlers.handle_validation_error)
@@ -29,6 +34,8 @@ def check_pulse():
 
 
 @api.route('/games', methods=['GET'])
+@replica_router.read_only
+@response_cache.cached
 def games():
     """Returns a list of games. Games are by default
     paginated to 20 items per page, and can be filtered
@@ -38,42 +45,89 @@ def games():
         - page: The page of games to fetch (int)
         - per_page: The number of items to fetch per page (int)
         - price: Either 'free' or 'paid' (show only free or paid games)
+        - cursor: Fetch the page after this cursor instead of by page
+          number (pass a next_cursor from an earlier response, or leave
+          it blank to start from the first page)
+        - include_total: If false, skips counting games (total_pages
+          will be null)
     """
 
-    activity_schema = ActivitySchema()
-
     try:
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
     except ValueError:
         raise InvalidUsage('page and per_page must both be integers greater than 0')
     show = request.args.get('price')
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', 'true') != 'false'
 
-    # Begin building a query against the games table
-    game_query = Activity.query
+    # Begin building a query for the public fields of games (rows
+    # rather than ORM objects, since they're only serialized):
+    criteria = []
 
     # Filter out for only paid/free games if requested:
     if show in ['paid', 'free']:
-        game_query = game_query.filter(
-            Activity.paid == (show == 'paid')
-        )
+        criteria.append(Activity.paid == (show == 'paid'))
 
-    # Order by date added and apply pagination
-    game_query = game_query.order_by(
-        Activity.created_date.desc()
-    ).paginate(page=page, per_page=per_page)
-
-    results = activity_schema.dump(game_query.items, many=True)
-    return jsonify(
-        games=results,
-        page=game_query.page,
-        total_pages=game_query.pages,
-        next_page=game_query.next_num,
+    # Order by date added (newest first, ID breaking ties):
+    game_query = select(*Activity.public_columns()).where(*criteria).order_by(
+        Activity.created_date.desc(), Activity.id.desc()
+    )
+    count_query = select(functions.count()).select_from(Activity).where(*criteria)
+
+    if cursor is not None:
+        # Keyset pagination: pick up right after the last game the
+        # client saw, rather than counting through an offset.
+        if per_page < 1:
+            raise InvalidUsage('per_page must be an integer greater than 0')
+        total_pages = None
+        if include_total:
+            total_pages = math.ceil(db.session.execute(count_query).scalar() / per_page)
+        if cursor:
+            game_query = game_query.where(after_cursor(Activity, *decode_cursor(cursor)))
+        # Fetch one extra game to see whether there's anything after this page:
+        items = db.session.execute(game_query.limit(per_page + 1)).all()
+        has_more = len(items) > per_page
+        items = items[:per_page]
+        page, next_page = None, None
+    elif include_total:
+        # Page numbers out of range 404, as Flask-SQLAlchemy's paginate did:
+        if page < 1 or per_page < 1:
+            abort(404)
+        items = db.session.execute(game_query.offset((page - 1) * per_page).limit(per_page)).all()
+        if not items and page != 1:
+            abort(404)
+        total_pages = math.ceil(db.session.execute(count_query).scalar() / per_page)
+        next_page = page + 1 if page < total_pages else None
+        has_more = next_page is not None
+    else:
+        if page < 1 or per_page < 1:
+            raise InvalidUsage('page and per_page must both be integers greater than 0')
+        items = db.session.execute(game_query.offset((page - 1) * per_page).limit(per_page + 1)).all()
+        if not items and page != 1:
+            abort(404)
+        has_more = len(items) > per_page
+        items = items[:per_page]
+        total_pages, next_page = None, page + 1 if has_more else None
+
+    # Clients on any mode can carry on from here with a cursor:
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(items[-1].created_date, items[-1].id)
+
+    return json_response(dict(
+        games=dump_games(items),
+        page=page,
+        total_pages=total_pages,
+        next_page=next_page,
+        next_cursor=next_cursor,
         per_page=per_page
-    ), 200
+    ))
 
 
 @api.route('/games/search', methods=['GET'])
+@replica_router.read_only
+@response_cache.cached
 def search_games():
     """Searches for games (either by title or description)
     
@@ -81,45 +135,52 @@ def search_games():
         - query: Query terms to search for (string)
         - page: The page to access (int)
         - per_page: The number of results to return per page (int)
+        - highlight: If true, each game gets a `headline` with matching
+          words in its description wrapped in <mark> tags
     """
 
-    schema = ActivitySchema()
-
-
     try:
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
     except ValueError:
         raise InvalidUsage('page and per_page must both be integers greater than 0')
+    if page < 1 or per_page < 1:
+        raise InvalidUsage('page and per_page must both be integers greater than 0')
     query = request.args.get('query')
+    highlight = request.args.get('highlight', 'false') == 'true'
 
     if query:
-        db_results = Activity.search(query, page=page, per_page=per_page)
-        results = schema.dump(db_results.results, many=True)
+        db_results = Activity.search(query, page=page, per_page=per_page, headlines=highlight)
+        results = dump_games(db_results.results)
+        if highlight:
+            for result, row in zip(results, db_results.results):
+                result['headline'] = render_headline(row.headline)
 
-        return jsonify(
+        return json_response(dict(
             games=results,
             page=page,
             total_pages=db_results.total_pages,
             next_page=db_results.next_page
-        ), 200
+        ))
 
     return jsonify(games=[], page=1, total_pages=1, next_page=None)
 
 
 @api.route('/games/<int:id>', methods=['GET'])
+@replica_router.read_only
+@response_cache.cached
 def get_game(id):
     """Fetches a game by ID.
     """
-    schema = ActivitySchema()
+    game = Activity.get_public(id)
+    if game is None:
+        abort(404)
 
-    # get_or_404 will immediately 404 if nothing was found
-    game = Activity.query.get_or_404(id)
-
-    return jsonify(game=schema.dump(game))
+    return json_response(dict(game=dump_game(game)))
 
 
 @api.route('/games/random', methods=['GET'])
+@replica_router.read_only
 def random_game():
     """Pulls a game at random (given some parameters
     to choose the game from -- passed in via URL
@@ -129,8 +190,6 @@ def random_game():
         - players: The number of players in the party
     """
 
-    schema = ActivitySchema()
-
     # Validate our query param input:
     free_only = request.args.get('free_only', 'false')
     players = request.args.get('players')
@@ -145,28 +204,10 @@ def random_game():
     if players < 1:
         raise InvalidUsage("players must be at least 1")
 
-    # Pull IDs matching these conditions from the database:
-    game_query = Activity.query
-
-    # Find games such that min players <= players <= max_players
-    # (max players can also be null in the case where a game has
-    # a practically infinite # of players)
-    game_query = game_query.filter(
-        Activity.min_players <= players,
-        or_(Activity.max_players >= players, column('max_players').is_(None))
-    )
+    game = random_index.random_game(players, free_only=(free_only == 'true'))
 
-    # Add a filter against paid games if the user chooses:
-    if free_only == 'true':
-        game_query = game_query.filter(Activity.paid == False)
-    
-    # Get a list of primary key IDs representing the games:
-    ids = [game.id for game in game_query.all()]
-    
-    # Then pick randomly from them:
-    if len(ids) > 0:
-        game = Activity.query.get(choice(ids))
-        return jsonify(game=schema.dump(game)), 200
+    if game is not None:
+        return json_response(dict(game=dump_game(game)))
     else:
         return jsonify(message="No games found"), 404
 
@@ -177,6 +218,8 @@ def consume_suggestion():
     """Pushes a game suggestion to the database. Expects a JSON
     payload conforming to the submission schema.
     """
+    from src.schema import SubmissionSchema
+
     # Perform validation on what we receive:
     schema = SubmissionSchema()
     input_json = request.get_json()
@@ -274,61 +317,113 @@ def list_submissions(current_user=None):
     if not current_user:
         raise AuthError("You need to be authorized to access this endpoint")
 
+    from src.schema import SubmissionSchema
     schema = SubmissionSchema()
 
     # Get all submissions that haven't been marked as archived
     # or approved:
-    submission_query = Submission.query
-    submission_query = submission_query.filter(
-        Submission.archived != True,
-        Submission.approved != True
-    ).order_by(Submission.created_date.desc())
-
-    results = schema.dump(submission_query.all(), many=True)
+    results = schema.dump(Submission.pending().all(), many=True)
     
     return jsonify(submissions=results), 200
 
 
+@api.route('/admin/cache', methods=['GET'])
+@requires_auth
+def cache_report(current_user=None):
+    """Reports how well the response cache is doing in this process.
+    """
+
+    if not current_user:
+        raise AuthError("You need to be authorized to access this endpoint")
+
+    return jsonify(cache=response_cache.report()), 200
+
+
+@api.route('/admin/replicas', methods=['GET'])
+@requires_auth
+def replica_report(current_user=None):
+    """Reports the state of the read replicas, as seen from this
+    process, and where reads have gone.
+    """
+
+    if not current_user:
+        raise AuthError("You need to be authorized to access this endpoint")
+
+    return jsonify(replica_router.report()), 200
+
+
 @api.route('/admin/bulk_import', methods=['POST'])
 @requires_auth
 def bulk_import_submissions(current_user=None):
     """Adds many games at once (useful for a migration to 
     another server). Requires authentication as an admin.
+
+    Games are nested under a 'games' key in a JSON payload. They're
+    validated and inserted in chunks, and invalid games are reported
+    (by position) without holding up the rest. For uploads too big to
+    hold in memory, see bulk_import_stream.
+
+    Query params:
+        - skip_duplicates: If true, games with a URL already in the
+          catalog are skipped
     """
 
     if not current_user:
         raise AuthError("You need to be authorized to access this endpoint")
-    
-    schema = ActivitySchema(many=True)
+
+    skip_duplicates = request.args.get('skip_duplicates', 'false') == 'true'
+
     try:
         games = request.get_json().get('games')
     except Exception as e:
         raise InvalidUsage("Please nest games under the 'games' key in your JSON payload")
+    if not isinstance(games, list):
+        raise InvalidUsage("Please nest games under the 'games' key in your JSON payload")
 
-    try:
-        # Attempt to validate and deserialize input data:
-        validated = schema.load(games)
-        deserialized_games = []
-        for game in validated:
-            # TODO: Filter fields at the schema level instead of here
-            deserialized_games.append(Activity(
-                name=game.get('name'),
-                description=game.get('description'),
-                max_players=game.get('max_players'),
-                min_players=game.get('min_players'),
-                created_date=game.get('created_date'),
-                paid=game.get('paid'),
-                submitted_by=game.get('submitted_by'),
-                url=game.get('url')
-            ))
-        # Then, load into the database:
-        db.session.add_all(deserialized_games)
-        db.session.commit()
-        return jsonify(message=f'{len(deserialized_games)} games added to database'), 200
-    except ValidationError:
-        raise
-    except Exception as e:
-        current_app.logger.error(f'Unhandled exception during bulk import: {e}')
-        return jsonify(message='Internal server error'), 500
+    from src.bulk import import_games
+    report = import_games(
+        games,
+        chunk_size=current_app.config['BULK_IMPORT_CHUNK_SIZE'],
+        skip_duplicates=skip_duplicates
+    )
+    return import_summary(report)
 
 
+@api.route('/admin/bulk_import/stream', methods=['POST'])
+@requires_auth
+def bulk_import_stream(current_user=None):
+    """Adds games from a newline-delimited JSON upload (Content-Type:
+    application/x-ndjson, one game per line). The body is read as it
+    streams in and inserted in chunks, so memory use doesn't grow with
+    the size of the upload. Invalid games are reported by line number.
+
+    Query params:
+        - skip_duplicates: If true, games with a URL already in the
+          catalog are skipped
+    """
+
+    if not current_user:
+        raise AuthError("You need to be authorized to access this endpoint")
+
+    if request.mimetype != 'application/x-ndjson':
+        raise InvalidUsage("Please send games as newline-delimited JSON (application/x-ndjson)", status_code=415)
+
+    skip_duplicates = request.args.get('skip_duplicates', 'false') == 'true'
+
+    from src.bulk import import_ndjson
+    report = import_ndjson(
+        request.stream,
+        chunk_size=current_app.config['BULK_IMPORT_CHUNK_SIZE'],
+        skip_duplicates=skip_duplicates
+    )
+    return import_summary(report)
+
+
+def import_summary(report):
+    """Responds with how a bulk import went: a 200 if every game was
+    imported (or skipped as a duplicate), otherwise a 422.
+    """
+    message = f'{report.inserted} games added to database'
+    if report.errors:
+        return jsonify(message=f'{message}, but some could not be imported', **report.to_dict()), 422
+    return jsonify(message=message, **report.to_dict()), 200
@@ -0,0 +1,79 @@
+"""Seeding the games table: the hand-picked games in seed/seed.json, and
+(for load testing) any number of synthetic ones generated by Postgres.
+Both are idempotent, skipping games whose URL is already in the table.
+"""
+
+import time
+
+from sqlalchemy import text
+
+from seed import seed_game_entries
+from src.bulk import import_games
+from src.restore import indexes_dropped
+
+# Builds games 1 to :n server-side (skipping any already there), so
+# large catalogs take seconds rather than round trips per row. Each
+# game's "random" picks (r[1] to r[10], in [0, 1)) are hashed from its
+# number and :seed, so they don't depend on which rows get inserted:
+SYNTHETIC_GAMES_SQL = """
+with words as (
+    select
+        array['secret', 'mega', 'party', 'pixel', 'space', 'word', 'drawing',
+              'trivia', 'murder', 'card', 'puzzle', 'escape', 'quiz', 'tiny',
+              'haunted', 'royal', 'cosmic', 'hidden', 'speedy', 'lucky'] as adjectives,
+        array['quest', 'heist', 'island', 'kingdom', 'dungeon', 'castle', 'race',
+              'room', 'mystery', 'battle', 'garden', 'tower', 'galaxy', 'arena',
+              'cafe', 'station', 'village', 'factory', 'circus', 'lab'] as nouns,
+        array['deduction', 'drawing', 'bluffing', 'trivia', 'cooperative', 'strategy',
+              'social', 'puzzle', 'word', 'racing', 'card', 'dice', 'building'] as genres
+)
+insert into activity (name, url, description, paid, min_players, max_players, created_date, submitted_by)
+select
+    initcap(adjectives[1 + floor(r[1] * 20)::int]) || ' ' ||
+        initcap(nouns[1 + floor(r[2] * 20)::int]) || ' ' || g,
+    'https://example.com/games/' || g,
+    'An online ' || genres[1 + floor(r[3] * 13)::int] || ' game set in a ' ||
+        adjectives[1 + floor(r[4] * 20)::int] || ' ' || nouns[1 + floor(r[5] * 20)::int] ||
+        '. Play with friends over video chat.',
+    r[6] < 0.25,
+    players.min_players,
+    case when r[7] < 0.3 then null else players.min_players + floor(r[8] * 10)::int end,
+    now() - (r[9] * interval '1000 days'),
+    'synthetic'
+from words, generate_series(1, :n) g,
+    lateral (
+        select array_agg((hashtext(g || ':' || k || ':' || cast(:seed as text))::bigint + 2147483648) / 4294967296::float8
+                         order by k) as r
+        from generate_series(1, 10) k
+    ) rolls,
+    lateral (select 1 + floor(r[10] * 6)::int as min_players) players
+where not exists (
+    select 1 from activity where url = 'https://example.com/games/' || g
+)
+"""
+
+
+def seed_games():
+    """Adds the games in seed/seed.json that aren't in the table yet, in
+    a single insert. Returns the ImportReport.
+    """
+    games = seed_game_entries().get('games')
+    return import_games(games, chunk_size=len(games) or 1, skip_duplicates=True)
+
+
+def synthesize_games(engine, n, seed=0.42, rebuild_indexes=True):
+    """Generates synthetic games 1 to `n` (realistic-looking names,
+    descriptions, player counts and dates) in one statement, skipping
+    those already there. The same seed always gives the same games (bar
+    their dates, which are counted back from now), whatever's already
+    in the table.
+
+    With rebuild_indexes, the table's indexes are dropped while rows
+    go in and rebuilt at the end, which is much quicker for large n.
+    Returns (games added, seconds taken).
+    """
+    start = time.perf_counter()
+    with indexes_dropped(engine, drop=rebuild_indexes):
+        with engine.begin() as connection:
+            added = connection.execute(text(SYNTHETIC_GAMES_SQL), {'n': n, 'seed': seed}).rowcount
+    return added, time.perf_counter() - start
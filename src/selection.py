@@ -0,0 +1,226 @@
+"""In-process index used to pick random games for /games/random
+without filtering the activity table on every request.
+"""
+
+import bisect
+import random
+import threading
+import time
+from array import array
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from src.database import db
+from src.metrics import random_index_bytes, random_index_ids, random_index_rebuild_seconds, random_index_rebuilds
+from src.model import Activity
+
+
+class RandomGameIndex(object):
+    """Maps each (players, free_only) bucket, for parties of 1 up to
+    `max_players`, to the IDs of the games that bucket can play.
+
+    IDs are stored once each, in compact arrays grouped by a game's
+    (min players, max players, paid) -- there are only a few hundred
+    such groups. Each bucket keeps the groups it can play along with
+    their running sizes, so a pick is a random number, a binary search
+    over those groups and an array lookup, regardless of catalog size.
+
+    Games inserted through the ORM are added as their transaction
+    commits. Anything else (deletes, Core inserts in other processes)
+    is picked up by a full rebuild once the index is `ttl` seconds old,
+    or right away after invalidate().
+    """
+
+    def __init__(self, max_players=20, ttl=300):
+        self.enabled = True
+        self.max_players = max_players
+        self.ttl = ttl
+        self.stats = Counter()
+        self.last_rebuild_seconds = None
+        self._groups = None
+        self._buckets = {}
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RANDOM_INDEX_ENABLED', self.enabled)
+        self.max_players = app.config.get('RANDOM_INDEX_MAX_PLAYERS', self.max_players)
+        self.ttl = app.config.get('RANDOM_INDEX_TTL', self.ttl)
+        self.invalidate()
+        self.stats.clear()
+
+    def invalidate(self):
+        """Drops the index, so the next pick rebuilds it.
+        """
+        with self._lock:
+            self._groups = None
+            self._buckets = {}
+            self._built_at = None
+
+    @property
+    def size(self):
+        """Number of game IDs held in the index.
+        """
+        return sum(len(ids) for ids in (self._groups or {}).values())
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the ID arrays, in bytes.
+        """
+        return sum(ids.itemsize * len(ids) for ids in (self._groups or {}).values())
+
+    def random_game(self, players, free_only=False):
+        """Returns a row of public fields for a random game a party of
+        `players` can play (or None). Falls back to Activity.random when
+        the index is off or doesn't cover a party that size.
+        """
+        if not self.enabled or players > self.max_players:
+            self.stats['fallbacks'] += 1
+            return Activity.random(players, free_only)
+
+        game_id = self.pick(players, free_only)
+        if game_id is None:
+            return None
+
+        game = Activity.get_public(game_id)
+        if game is None:
+            # The game was deleted since we last rebuilt:
+            self.stats['fallbacks'] += 1
+            self.invalidate()
+            return Activity.random(players, free_only)
+        return game
+
+    def pick(self, players, free_only=False):
+        """Returns the ID of a random game in the given bucket, or None
+        if it's empty.
+        """
+        buckets = self._ensure_fresh()
+        self.stats['picks'] += 1
+
+        groups, running_sizes = buckets.get((players, free_only), ((), ()))
+        if not running_sizes or running_sizes[-1] == 0:
+            return None
+
+        position = random.randrange(running_sizes[-1])
+        group = bisect.bisect_right(running_sizes, position)
+        start = running_sizes[group - 1] if group else 0
+        return groups[group][position - start]
+
+    def add(self, games):
+        """Adds newly inserted games, as (id, min_players, max_players,
+        paid) tuples, to the index (if it's been built).
+        """
+        with self._lock:
+            if self._groups is None:
+                return
+            for game in games:
+                self._add(self._groups, *game)
+            self._buckets = self._bucket(self._groups)
+            self._record_size()
+
+    def rebuild(self):
+        start = time.perf_counter()
+
+        groups = {}
+        statement = select(Activity.id, Activity.min_players, Activity.max_players, Activity.paid)
+        for row in db.session.execute(statement.execution_options(yield_per=10000)):
+            self._add(groups, *row)
+
+        self._groups = groups
+        self._buckets = self._bucket(groups)
+        self._built_at = time.monotonic()
+
+        self.last_rebuild_seconds = time.perf_counter() - start
+        self.stats['rebuilds'] += 1
+        random_index_rebuilds.inc()
+        random_index_rebuild_seconds.set(self.last_rebuild_seconds)
+        self._record_size()
+        current_app.logger.info(
+            f'Rebuilt random game index: {self.size} IDs ({self.nbytes} bytes) '
+            f'in {self.last_rebuild_seconds * 1000:.1f}ms'
+        )
+
+    def _ensure_fresh(self):
+        """Returns the buckets to pick from, rebuilding them first if
+        they're stale. Picks use what this returns rather than reading
+        self._buckets again, which invalidate() may have emptied since.
+        """
+        buckets = self._buckets
+        built_at = self._built_at
+        if buckets and built_at is not None and time.monotonic() - built_at < self.ttl:
+            return buckets
+
+        # Only one thread rebuilds. Others carry on with the old index
+        # if there is one, or wait for the rebuild if not:
+        if not self._lock.acquire(blocking=not buckets):
+            return buckets
+        try:
+            if self._built_at is None or self._built_at == built_at:
+                self.rebuild()
+            return self._buckets
+        finally:
+            self._lock.release()
+
+    def _record_size(self):
+        random_index_ids.set(self.size)
+        random_index_bytes.set(self.nbytes)
+
+    def _add(self, groups, id, min_players, max_players, paid):
+        if min_players > self.max_players:
+            return
+        # Games taking more players than we index behave like unlimited ones:
+        if max_players is None or max_players > self.max_players:
+            max_players = self.max_players
+        groups.setdefault((min_players, max_players, paid), array('l')).append(id)
+
+    def _bucket(self, groups):
+        buckets = {}
+        for players in range(1, self.max_players + 1):
+            for free_only in (False, True):
+                eligible = [
+                    ids for (min_players, max_players, paid), ids in groups.items()
+                    if min_players <= players <= max_players and not (free_only and paid)
+                ]
+                running_sizes, total = [], 0
+                for ids in eligible:
+                    total += len(ids)
+                    running_sizes.append(total)
+                buckets[(players, free_only)] = (eligible, running_sizes)
+        return buckets
+
+
+random_index = RandomGameIndex()
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_written_games(session, flush_context):
+    """Remembers games written in this transaction, so the index can be
+    updated once (and only if) it commits.
+    """
+    new_games = [
+        (game.id, game.min_players, game.max_players, game.paid)
+        for game in session.new if isinstance(game, Activity)
+    ]
+    if new_games:
+        session.info.setdefault('new_games', []).extend(new_games)
+    if any(isinstance(game, Activity) for game in list(session.dirty) + list(session.deleted)):
+        session.info['games_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_written_games(session):
+    new_games = session.info.pop('new_games', [])
+    if session.info.pop('games_changed', False):
+        random_index.invalidate()
+    elif new_games:
+        random_index.add(new_games)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_written_games(session, previous_transaction):
+    session.info.pop('new_games', None)
+    session.info.pop('games_changed', None)
+
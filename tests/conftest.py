@@ -6,8 +6,7 @@ from sqlalchemy import text
 import flask_migrate
 from src import create_app
 from src.database import db
-from src.model import Activity
-from seed import seed_game_entries
+from src.seeding import seed_games
 
 @pytest.fixture
 def app():
@@ -21,12 +20,7 @@ def app():
         db.metadata.create_all(checkfirst=True, bind=db.engine)
         
         # Seed initial records to the database for testing:
-        game_entries = seed_game_entries()
-
-        for game in game_entries.get('games'):
-            activity = Activity(**game)
-            db.session.add(activity)
-        db.session.commit()
+        seed_games()
     
     yield app
     # Teardown: Drop all tables
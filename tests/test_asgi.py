@@ -0,0 +1,176 @@
+"""Tests on the ASGI entry point. Requests are sent straight to the
+ASGI callable; none of them touch the database.
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('asyncpg')
+
+from flask import request
+
+from src.asgi import async_engine_options, async_url, blocking_backends, create_asgi_app, wsgi_environ
+
+
+@pytest.fixture
+def asgi_app():
+    return create_asgi_app('src.config.TestConfig')
+
+
+def scope_for(path, method='GET', query_string=b'', headers=()):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query_string, 'root_path': '',
+        'headers': list(headers), 'client': ('10.0.0.1', 5555), 'server': ('testserver', 80), 'http_version': '1.1',
+    }
+
+
+def call(app, scope, body=b''):
+    """Sends one request through an ASGI app, returning the messages it
+    sent back. The body can be given as a list of chunks.
+    """
+    chunks = body if isinstance(body, list) else [body]
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def test_wsgi_environ():
+    environ = wsgi_environ(scope_for(
+        '/v1/games', query_string=b'page=2',
+        headers=[(b'content-type', b'application/json'), (b'x-forwarded-for', b'1.2.3.4'), (b'accept', b'a'),
+                 (b'accept', b'b'), (b'cookie', b'a=1'), (b'cookie', b'b=2')]
+    ), b'{}')
+
+    assert environ['PATH_INFO'] == '/v1/games'
+    assert environ['QUERY_STRING'] == 'page=2'
+    assert environ['CONTENT_TYPE'] == 'application/json'
+    assert environ['HTTP_X_FORWARDED_FOR'] == '1.2.3.4'
+    assert environ['HTTP_ACCEPT'] == 'a,b'
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+    assert environ['REMOTE_ADDR'] == '10.0.0.1'
+    assert environ['wsgi.input'].read() == b'{}'
+
+
+def test_async_url():
+    config = {'DB_PGBOUNCER': False}
+    assert str(async_url('postgresql://wswp@db/wswp', config)) == 'postgresql+asyncpg://wswp@db/wswp'
+
+    config = {'DB_PGBOUNCER': True}
+    assert async_url('postgresql+psycopg2://wswp@db/wswp', config).query == {'prepared_statement_cache_size': '0'}
+
+    # As DigitalOcean's managed databases give them:
+    config = {'DB_PGBOUNCER': False}
+    url = async_url('postgresql://wswp@db:25060/wswp?sslmode=require&connect_timeout=5', config)
+    assert url.query == {'ssl': 'require'}
+
+
+def test_async_connect_args(asgi_app):
+    url = 'postgresql://wswp@db/wswp?connect_timeout=5&application_name=wswp&options=-c%20search_path%3Dgames'
+    options = async_engine_options(dict(asgi_app.app.config, DB_STATEMENT_TIMEOUT_MS=5000), url)
+
+    assert options['connect_args'] == {
+        'timeout': 5.0,
+        'server_settings': {'search_path': 'games', 'application_name': 'wswp', 'statement_timeout': '5000'},
+    }
+
+
+def test_routing(asgi_app):
+    def runs_async(path, method='GET'):
+        return asgi_app.runs_async(wsgi_environ(scope_for(path, method), b''))
+
+    assert runs_async('/v1/games')
+    assert runs_async('/v1/games/search')
+    assert runs_async('/v1/games/12')
+    assert not runs_async('/v1/games/random')
+    assert not runs_async('/v1/games/suggest', method='POST')
+    assert not runs_async('/v1/nothing-here')
+
+
+def test_blocking_backends_served_on_threads(asgi_app, monkeypatch):
+    config = {'RESPONSE_CACHE_BACKEND': 'memory', 'RATELIMIT_STORAGE_URI': 'bounded-memory://'}
+    assert blocking_backends(config) == []
+    assert blocking_backends(dict(config, RATELIMIT_STORAGE_URI='redis://cache:6379')) == ['RATELIMIT_STORAGE_URI=redis://']
+    assert blocking_backends(dict(config, RATELIMIT_STORAGE_URI='redis://cache:6379', RATELIMIT_ENABLED=False)) == []
+    assert blocking_backends(dict(config, RESPONSE_CACHE_BACKEND='redis')) == ['RESPONSE_CACHE_BACKEND=redis']
+
+    monkeypatch.setattr(asgi_app, 'blocking_backends', ['RESPONSE_CACHE_BACKEND=redis'])
+    assert not asgi_app.runs_async(wsgi_environ(scope_for('/v1/games'), b''))
+
+
+def test_served_through_flask(asgi_app):
+    start, body = call(asgi_app, scope_for('/v1/pulse'))
+
+    assert start['status'] == 200
+    assert (b'content-type', b'application/json') in start['headers']
+    assert b'API is online' in body['body']
+
+    start, body = call(asgi_app, scope_for('/v1/admin/submissions'))
+    assert start['status'] == 401
+
+
+def test_lifespan(asgi_app):
+    messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(asgi_app({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+def test_served_async(asgi_app, monkeypatch):
+    monkeypatch.setattr('src.asgi.ASYNC_ENDPOINTS', ('api.check_pulse',))
+    start, body = call(asgi_app, scope_for('/v1/pulse'))
+
+    assert start['status'] == 200
+    assert b'API is online' in body['body']
+
+
+def test_body_streamed_to_threads(asgi_app):
+    chunks = [b'{"a": 1}\n', b'{"b": 2}\n', b'{"c": 3}\n']
+    seen = []
+
+    @asgi_app.app.route('/upload', methods=['POST'])
+    def upload():
+        # Each line is read before the client has sent the next one:
+        for line in request.stream:
+            seen.append((line, len(chunks)))
+        return ''
+
+    start, _ = call(asgi_app, scope_for('/upload', method='POST'), chunks)
+    assert start['status'] == 200
+    assert seen == [(b'{"a": 1}\n', 2), (b'{"b": 2}\n', 1), (b'{"c": 3}\n', 0)]
+
+
+def test_max_content_length(asgi_app, monkeypatch):
+    asgi_app.app.config['MAX_CONTENT_LENGTH'] = 8
+
+    @asgi_app.app.route('/upload', methods=['POST'])
+    def upload():
+        return request.get_data()
+
+    # Whether or not the client said how big the body is:
+    start, _ = call(asgi_app, scope_for('/upload', method='POST'), [b'0123', b'4567', b'89'])
+    assert start['status'] == 413
+    start, _ = call(asgi_app, scope_for('/upload', method='POST', headers=[(b'content-length', b'10')]), b'0123456789')
+    assert start['status'] == 413
+    start, body = call(asgi_app, scope_for('/upload', method='POST'), [b'0123', b'4567'])
+    assert start['status'] == 200 and body['body'] == b'01234567'
+
+    monkeypatch.setattr('src.asgi.ASYNC_ENDPOINTS', ('api.check_pulse',))
+    start, _ = call(asgi_app, scope_for('/v1/pulse'), b'0123456789')
+    assert start['status'] == 413
@@ -0,0 +1,249 @@
+"""Tests on validating admin tokens, including caching of the signing keys
+used to verify them. A local HTTP server stands in for Auth0's JWKS endpoint.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+import rsa
+from jose import jwk, jwt
+
+from src import create_app
+from src.auth import requires_auth, jwks_cache, token_cache
+from src.exceptions import AuthError
+from src.jwks import JWKSCache
+
+
+def make_keypair(kid):
+    """Generates an RSA keypair, returning the private key (PEM) and
+    the public key as a JWK entry.
+    """
+    public_key, private_key = rsa.newkeys(1024)
+    public_jwk = jwk.construct(public_key.save_pkcs1().decode(), 'RS256').to_dict()
+    public_jwk.update(kid=kid, use='sig')
+    return private_key.save_pkcs1().decode(), public_jwk
+
+
+class JWKSServer(object):
+    """Serves whatever is in `keys` as a JWKS document and counts
+    how many times it was fetched.
+    """
+
+    def __init__(self, delay=0):
+        self.keys = []
+        self.fetches = 0
+        self.delay = delay
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.fetches += 1
+                time.sleep(server.delay)
+                body = json.dumps({"keys": server.keys}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/.well-known/jwks.json'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(scope='module')
+def keypair():
+    return make_keypair('key-1')
+
+
+@pytest.fixture
+def jwks_server(keypair):
+    server = JWKSServer()
+    server.keys = [keypair[1]]
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def auth_app(jwks_server, monkeypatch):
+    """An application object pointed at the local JWKS server. No database
+    is needed since the protected view is defined here.
+    """
+    monkeypatch.setenv('AUTH0_DOMAIN', 'wswp.test')
+    monkeypatch.setenv('AUTH0_API_AUDIENCE', 'wswp-api')
+    app = create_app('src.config.TestConfig')
+    app.config['ADMIN_OFF'] = False
+    jwks_cache.url = jwks_server.url
+    return app
+
+
+def sign(private_key, kid, **claims):
+    payload = {
+        'sub': 'admin',
+        'aud': 'wswp-api',
+        'iss': 'https://wswp.test/',
+        'exp': int(time.time()) + 3600
+    }
+    payload.update(claims)
+    return jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': kid})
+
+
+@requires_auth
+def protected_view(current_user=None):
+    return current_user
+
+
+def call_protected(app, token):
+    with app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+        return protected_view()
+
+
+def test_keys_cached_between_lookups(jwks_server, keypair):
+    """Only the first lookup of a known kid should hit the JWKS endpoint.
+    """
+    cache = JWKSCache(url=jwks_server.url)
+
+    for _ in range(5):
+        assert cache.get_key('key-1') is not None
+
+    assert jwks_server.fetches == 1
+    assert cache.stats['refreshes'] == 1
+    assert cache.stats['misses'] == 1
+    assert cache.stats['hits'] == 4
+
+
+def test_keys_refetched_after_ttl(jwks_server):
+    cache = JWKSCache(url=jwks_server.url, ttl=0)
+
+    cache.get_key('key-1')
+    cache.get_key('key-1')
+
+    assert jwks_server.fetches == 2
+
+
+def test_unknown_kid_cooldown(jwks_server):
+    """An unknown kid triggers a refresh, but repeated unknown kids
+    shouldn't trigger more than one fetch per cooldown.
+    """
+    cache = JWKSCache(url=jwks_server.url, miss_cooldown=60)
+
+    assert cache.get_key('key-1') is not None
+    assert cache.get_key('not-a-key') is None
+    assert cache.get_key('also-not-a-key') is None
+
+    assert jwks_server.fetches == 1
+
+
+def test_rotated_key_picked_up(jwks_server, keypair):
+    """A token signed with a newly rotated key should be picked up with
+    a single refresh.
+    """
+    cache = JWKSCache(url=jwks_server.url, miss_cooldown=0)
+    cache.get_key('key-1')
+
+    _, rotated_jwk = make_keypair('key-2')
+    jwks_server.keys = [keypair[1], rotated_jwk]
+
+    assert cache.get_key('key-2') is not None
+    assert jwks_server.fetches == 2
+
+
+def test_single_flight_refresh(jwks_server):
+    """Concurrent lookups against a cold cache should result in one fetch.
+    """
+    jwks_server.delay = 0.2
+    cache = JWKSCache(url=jwks_server.url)
+    found = []
+
+    threads = [threading.Thread(target=lambda: found.append(cache.get_key('key-1'))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(key is not None for key in found)
+    assert jwks_server.fetches == 1
+
+
+def test_stale_keys_served_on_refresh_failure(jwks_server):
+    cache = JWKSCache(url=jwks_server.url, ttl=0)
+    cache.get_key('key-1')
+
+    jwks_server.close()
+
+    assert cache.get_key('key-1') is not None
+    assert cache.stats['refresh_failures'] == 1
+
+
+def test_requires_auth_valid_token(auth_app, jwks_server, keypair):
+    token = sign(keypair[0], 'key-1')
+
+    for _ in range(3):
+        current_user = call_protected(auth_app, token)
+        assert current_user['sub'] == 'admin'
+
+    assert jwks_server.fetches == 1
+
+
+@pytest.mark.parametrize('claims, kid', [
+    ({'exp': 1}, 'key-1'),
+    ({'aud': 'someone-else'}, 'key-1'),
+    ({}, 'unknown-key')
+])
+def test_requires_auth_invalid_token(auth_app, keypair, claims, kid):
+    token = sign(keypair[0], kid, **claims)
+
+    with pytest.raises(AuthError):
+        call_protected(auth_app, token)
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    """Records each time a token's signature is verified.
+    """
+    calls = []
+    original_decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args[0])
+        return original_decode(*args, **kwargs)
+
+    monkeypatch.setattr('jose.jwt.decode', counting_decode)
+    return calls
+
+
+def test_verified_tokens_cached(auth_app, keypair, verifications):
+    """Repeat calls with the same token should only verify its
+    signature once.
+    """
+    token = sign(keypair[0], 'key-1')
+
+    for _ in range(5):
+        assert call_protected(auth_app, token)['sub'] == 'admin'
+
+    assert len(verifications) == 1
+    assert token_cache.stats['hits'] == 4
+
+
+def test_cached_token_expires(auth_app, keypair, verifications, monkeypatch):
+    """Cached tokens shouldn't outlive their own exp claim.
+    """
+    expiry = int(time.time()) + 60
+    token = sign(keypair[0], 'key-1', exp=expiry)
+    call_protected(auth_app, token)
+
+    monkeypatch.setattr('src.cache.time', SimpleNamespace(time=lambda: expiry + 1))
+    call_protected(auth_app, token)
+
+    assert len(verifications) == 2
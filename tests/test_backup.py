@@ -0,0 +1,93 @@
+"""Tests on backing up the game tables. A fake S3 client stands in for
+remote storage.
+"""
+
+import gzip
+import io
+import json
+
+import pytest
+
+from src.backup import (HashingWriter, LocalStorage, S3Storage, backup_tables, compressed_writer,
+                        decompressed_reader, read_manifest, storage_for, verify_backup)
+
+
+class FakeS3Client(object):
+    """Keeps uploaded objects in a dict, keyed by (bucket, key).
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, file, bucket, key):
+        self.objects[(bucket, key)] = file.read()
+
+    def download_fileobj(self, bucket, key, file):
+        file.write(self.objects[(bucket, key)])
+
+
+def read_lines(storage, name, entry, compression='gzip'):
+    with storage.open_read(f"{name}/{entry['file']}") as file:
+        return [json.loads(line) for line in decompressed_reader(file, compression)]
+
+
+def test_storage_for():
+    assert isinstance(storage_for('/var/backups'), LocalStorage)
+
+    storage = S3Storage('wswp', '/nightly/', client=FakeS3Client())
+    assert storage.key_for('manifest.json') == 'nightly/manifest.json'
+
+
+def test_compressed_and_hashed():
+    file = io.BytesIO()
+    hashing = HashingWriter(file)
+    with compressed_writer(hashing, 'gzip') as writer:
+        writer.write(b'{"id":1}\n')
+
+    assert gzip.decompress(file.getvalue()) == b'{"id":1}\n'
+    assert hashing.size == len(file.getvalue())
+
+
+def test_s3_storage_round_trip():
+    client = FakeS3Client()
+    storage = S3Storage('wswp', 'nightly', client=client)
+
+    with storage.open_write('games/manifest.json') as file:
+        file.write(b'{}')
+    with storage.open_read('games/manifest.json') as file:
+        assert file.read() == b'{}'
+
+    assert ('wswp', 'nightly/games/manifest.json') in client.objects
+
+
+def test_backup_games_command(runner, tmp_path):
+    result = runner.invoke(args=['admin', 'backup-games', '--target', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+
+    storage = LocalStorage(str(tmp_path))
+    name = next(tmp_path.iterdir()).name
+    manifest = read_manifest(storage, name)
+
+    assert list(manifest['tables']) == ['activity']
+    entry = manifest['tables']['activity']
+    assert entry['rows'] == 13
+    games = read_lines(storage, name, entry)
+    assert len(games) == 13
+    assert 'search_vector' not in games[0]
+    assert verify_backup(storage, name) == []
+
+
+def test_backup_to_s3(app):
+    client = FakeS3Client()
+    storage = S3Storage('wswp', 'nightly', client=client)
+
+    with app.app_context():
+        manifest = backup_tables(storage, tables=('activity', 'submissions'), name='games-test')
+
+    assert manifest['tables']['submissions']['rows'] == 0
+    assert len(read_lines(storage, 'games-test', manifest['tables']['activity'])) == 13
+    assert verify_backup(storage, 'games-test') == []
+
+    # Tampering with a file is caught:
+    client.objects[('wswp', 'nightly/games-test/activity.ndjson.gz')] += b'\0'
+    assert verify_backup(storage, 'games-test') == ["activity.ndjson.gz doesn't match its checksum"]
@@ -0,0 +1,130 @@
+"""Tests on bulk importing games.
+"""
+
+import hashlib
+import io
+import json
+
+import pytest
+
+from src.auth import token_cache
+from src.bulk import chunked, import_games, import_ndjson, read_ndjson
+from src.database import db
+from src.model import Activity
+from src.selection import random_index
+
+
+def make_games(n, start=0):
+    return [
+        {'name': f'Game {i}', 'url': f'https://example.com/games/{i}', 'min_players': 2, 'max_players': 6}
+        for i in range(start, start + n)
+    ]
+
+
+@pytest.fixture
+def admin_headers(app):
+    """Headers for an admin request, with its token already in the
+    verified token cache (so no signing keys are needed).
+    """
+    token = 'test-admin-token'
+    token_cache.set(hashlib.sha256(token.encode()).hexdigest(), {'sub': 'admin'})
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+def test_read_ndjson():
+    stream = io.BytesIO(b'{"name": "Codenames"}\n\nnot json\n{"name": "Skribbl"}')
+    assert list(read_ndjson(stream)) == [(1, {'name': 'Codenames'}), (3, None), (4, {'name': 'Skribbl'})]
+
+
+def test_import_in_chunks(app):
+    with app.app_context():
+        before = Activity.query.count()
+        report = import_games(iter(make_games(25)), chunk_size=10)
+
+        assert report.to_dict() == {'inserted': 25, 'skipped': 0, 'rejected': 0, 'chunks': 3, 'errors': []}
+        assert Activity.query.count() == before + 25
+        game = Activity.query.filter_by(name='Game 0').one()
+        assert game.paid is False
+        assert game.created_date is not None
+
+
+def test_invalid_games_reported(app):
+    games = make_games(25)
+    games[3]['min_players'] = 0
+    games[14] = None
+    del games[15]['url']
+
+    with app.app_context():
+        report = import_games(games, chunk_size=10)
+
+        assert report.inserted == 22
+        assert report.rejected == 3
+        assert [error['chunk'] for error in report.errors] == [0, 1]
+        assert list(report.errors[0]['issues']) == [3]
+        assert sorted(report.errors[1]['issues']) == [14, 15]
+
+
+def test_import_ndjson_reports_line_numbers(app):
+    lines = [json.dumps(game) for game in make_games(5)]
+    lines[1] = '{"name": "No URL"}'
+    lines.insert(3, '')
+    lines.insert(4, '{not json')
+    stream = io.BytesIO('\n'.join(lines).encode())
+
+    with app.app_context():
+        report = import_ndjson(stream, chunk_size=2)
+
+    assert report.inserted == 4
+    assert report.rejected == 2
+    issues = {}
+    for error in report.errors:
+        issues.update(error['issues'])
+    assert sorted(issues) == [2, 5]
+
+
+def test_skip_duplicates(app):
+    with app.app_context():
+        import_games(make_games(5))
+        games = make_games(10) + make_games(1, start=10) * 2
+
+        report = import_games(games, chunk_size=4, skip_duplicates=True)
+
+        assert report.inserted == 6
+        assert report.skipped == 6
+        assert Activity.query.filter_by(url='https://example.com/games/10').count() == 1
+
+
+def test_import_updates_random_index(app, client):
+    client.get('/v1/games/random?players=4')
+    size_before = random_index.size
+
+    with app.app_context():
+        import_games(make_games(10))
+
+    assert random_index.size == size_before + 10
+    assert random_index.stats['rebuilds'] == 1
+
+
+def test_stream_endpoint(client, admin_headers):
+    body = '\n'.join(json.dumps(game) for game in make_games(3)) + '\n{"name": "No URL"}\n'
+
+    rv = client.post(
+        '/v1/admin/bulk_import/stream', data=io.BytesIO(body.encode()),
+        content_type='application/x-ndjson', headers=admin_headers
+    )
+
+    assert rv.status_code == 422
+    summary = rv.get_json()
+    assert summary['inserted'] == 3
+    assert summary['rejected'] == 1
+    assert list(summary['errors'][0]['issues']) == ['4']
+
+
+def test_stream_endpoint_needs_ndjson(client, admin_headers):
+    rv = client.post('/v1/admin/bulk_import/stream', json={'games': []}, headers=admin_headers)
+    assert rv.status_code == 415
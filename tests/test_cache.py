@@ -0,0 +1,191 @@
+"""Tests on caching of responses from the public read endpoints.
+"""
+
+import datetime
+
+import pytest
+from flask import jsonify
+from werkzeug.http import http_date
+
+from src import create_app
+from src.cache import LRUCache, response_cache
+from src.config import TestConfig
+from src.database import db
+from src.model import Activity
+
+@pytest.fixture
+def cache_app():
+    """An application object with a cached view that counts how many
+    times it actually ran. No database is needed.
+    """
+    app = create_app('src.config.TestConfig')
+    calls = []
+
+    @app.route('/cached')
+    @response_cache.cached
+    def cached_view():
+        calls.append(1)
+        return jsonify(calls=len(calls))
+
+    @app.route('/cached/missing')
+    @response_cache.cached
+    def missing_view():
+        calls.append(1)
+        return jsonify(message="Not found"), 404
+
+    app.calls = calls
+    return app
+
+
+def test_repeat_requests_served_from_cache(cache_app):
+    client = cache_app.test_client()
+
+    first = client.get('/cached?b=2&a=1')
+    second = client.get('/cached?a=1&b=2')
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_data() == first.get_data()
+    assert len(cache_app.calls) == 1
+
+    report = response_cache.report()
+    assert report['hit_ratio'] == 0.5
+    assert report['bytes_cached'] == len(first.get_data())
+
+
+def test_different_args_cached_separately(cache_app):
+    client = cache_app.test_client()
+
+    client.get('/cached?page=1')
+    client.get('/cached?page=2')
+
+    assert len(cache_app.calls) == 2
+
+
+def test_bumping_version_invalidates(cache_app):
+    client = cache_app.test_client()
+
+    client.get('/cached')
+    response_cache.bump_version()
+    rv = client.get('/cached')
+
+    assert rv.headers['X-Cache'] == 'MISS'
+    assert len(cache_app.calls) == 2
+
+
+def test_errors_not_cached(cache_app):
+    client = cache_app.test_client()
+
+    client.get('/cached/missing')
+    rv = client.get('/cached/missing')
+
+    assert rv.status_code == 404
+    assert len(cache_app.calls) == 2
+
+
+def test_matching_etag_not_modified(cache_app):
+    client = cache_app.test_client()
+
+    etag = client.get('/cached').headers['ETag']
+    rv = client.get('/cached', headers={'If-None-Match': etag})
+
+    assert rv.status_code == 304
+    assert rv.headers['ETag'] == etag
+    assert rv.get_data() == b''
+    assert len(cache_app.calls) == 1
+
+
+def test_etag_changes_with_catalog(cache_app):
+    client = cache_app.test_client()
+
+    etag = client.get('/cached').headers['ETag']
+    response_cache.bump_version()
+    rv = client.get('/cached', headers={'If-None-Match': etag})
+
+    assert rv.status_code == 200
+    assert rv.headers['ETag'] != etag
+
+
+def test_if_modified_since(cache_app):
+    client = cache_app.test_client()
+
+    last_modified = client.get('/cached').last_modified
+    earlier = http_date(last_modified - datetime.timedelta(seconds=1))
+
+    assert client.get('/cached', headers={'If-Modified-Since': http_date(last_modified)}).status_code == 304
+    assert client.get('/cached', headers={'If-Modified-Since': earlier}).status_code == 200
+
+    # Any change to the catalog moves Last-Modified on, even within the
+    # same second:
+    response_cache.bump_version()
+    rv = client.get('/cached', headers={'If-Modified-Since': http_date(last_modified)})
+    assert rv.status_code == 200
+    assert rv.last_modified > last_modified
+
+
+def test_unreachable_redis_served_uncached(monkeypatch):
+    pytest.importorskip('redis')
+    monkeypatch.setattr(TestConfig, 'RESPONSE_CACHE_BACKEND', 'redis')
+    monkeypatch.setattr(TestConfig, 'RESPONSE_CACHE_URL', 'redis://127.0.0.1:1/0')
+    app = create_app('src.config.TestConfig')
+
+    @app.route('/cached')
+    @response_cache.cached
+    def cached_view():
+        return jsonify(cached=False)
+
+    with app.app_context():
+        response_cache.bump_version()
+    rv = app.test_client().get('/cached')
+
+    assert rv.status_code == 200
+    assert 'X-Cache' not in rv.headers
+    assert response_cache.backend.errors == 1
+    assert response_cache.report()['unavailable'] == 1
+
+
+def test_lru_bounded_by_bytes():
+    cache = LRUCache(max_entries=10, max_bytes=100)
+
+    for key in range(5):
+        cache.set(key, b'x' * 30, size=30)
+
+    assert cache.nbytes <= 100
+    assert cache.get(0) is None
+    assert cache.get(4) == b'x' * 30
+
+
+def test_games_cached_until_catalog_changes(client):
+    assert client.get('/v1/games').headers['X-Cache'] == 'MISS'
+    assert client.get('/v1/games').headers['X-Cache'] == 'HIT'
+
+    response_cache.bump_version()
+
+    assert client.get('/v1/games').headers['X-Cache'] == 'MISS'
+
+
+def test_games_not_modified_until_catalog_changes(app, client):
+    etag = client.get('/v1/games').headers['ETag']
+    assert client.get('/v1/games', headers={'If-None-Match': etag}).status_code == 304
+
+    with app.app_context():
+        db.session.add(Activity(name="Gartic Phone", url="https://garticphone.com", min_players=4, max_players=4))
+        db.session.commit()
+
+    rv = client.get('/v1/games', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert rv.headers['Last-Modified']
+
+
+def test_games_modified_after_delete(app, client):
+    """Deleting games doesn't add a newer one, but still counts as a
+    change for clients revalidating with If-Modified-Since.
+    """
+    last_modified = client.get('/v1/games').headers['Last-Modified']
+    assert client.get('/v1/games', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    with app.app_context():
+        db.session.delete(Activity.query.first())
+        db.session.commit()
+
+    assert client.get('/v1/games', headers={'If-Modified-Since': last_modified}).status_code == 200
@@ -2,10 +2,14 @@
 routes are covered in other modules.
 """
 
+import time
+from array import array
+
 import pytest
 
 from src.database import db
 from src.model import Activity
+from src.selection import RandomGameIndex, random_index
 
 def test_pulse(client):
     """Calls to /v1/pulse should return a 200.
@@ -111,3 +115,126 @@ def test_game_at_id(app, client, game_id, expected_code):
             assert game['name'] == activity.name
             assert game['description'] == activity.description
             assert game['paid'] == activity.paid
+
+
+@pytest.mark.parametrize("per_page", [1, 5, 13, 20])
+def test_cursor_pagination(client, per_page):
+    """Following next_cursor from a blank cursor should walk through every
+    game exactly once, in the same order as page-based pagination.
+    """
+    expected = [game['id'] for game in client.get('/v1/games?per_page=20').get_json()['games']]
+
+    seen = []
+    cursor = ''
+    while cursor is not None:
+        rv = client.get(f'/v1/games?per_page={per_page}&cursor={cursor}')
+        assert rv.status_code == 200
+        json_data = rv.get_json()
+        assert json_data['page'] is None
+        assert json_data['total_pages'] == -(-13 // per_page)
+        seen.extend(game['id'] for game in json_data['games'])
+        cursor = json_data['next_cursor']
+
+    assert seen == expected
+
+
+def test_cursor_from_page(client):
+    """A next_cursor handed out in page mode should continue where
+    that page left off.
+    """
+    first_page = client.get('/v1/games?per_page=10').get_json()
+    second_page = client.get(f"/v1/games?per_page=10&cursor={first_page['next_cursor']}").get_json()
+    by_page = client.get('/v1/games?per_page=10&page=2').get_json()
+
+    assert [game['id'] for game in second_page['games']] == [game['id'] for game in by_page['games']]
+    assert second_page['next_cursor'] is None
+
+
+@pytest.mark.parametrize("query_string", ['per_page=10', 'per_page=10&cursor='])
+def test_pagination_without_total(client, query_string):
+    rv = client.get(f'/v1/games?{query_string}&include_total=false')
+    json_data = rv.get_json()
+
+    assert len(json_data['games']) == 10
+    assert json_data['total_pages'] is None
+    assert json_data['next_cursor'] is not None
+
+
+@pytest.mark.parametrize("cursor", ['not-a-cursor', 'WyJ5ZXN0ZXJkYXkiLDFd'])
+def test_invalid_cursor(client, cursor):
+    rv = client.get(f'/v1/games?cursor={cursor}')
+    assert rv.status_code == 400
+
+
+def test_random_game_covers_eligible(app, client):
+    """Every game that fits the party should be able to come up.
+    """
+    with app.app_context():
+        eligible = {game.id for game in Activity.query.filter(Activity.eligible_for(4)).all()}
+
+    picked = set()
+    for _ in range(300):
+        picked.add(client.get('/v1/games/random?players=4').get_json()['game']['id'])
+
+    assert picked == eligible
+
+
+def test_random_game_none_found(app, client):
+    with app.app_context():
+        Activity.query.delete()
+        db.session.commit()
+
+    rv = client.get('/v1/games/random?players=4')
+    assert rv.status_code == 404
+
+
+def test_random_index_updated_on_insert(app, client):
+    """Games added after the random game index was built should be added
+    to it when they're committed, without a full rebuild.
+    """
+    client.get('/v1/games/random?players=4')
+    assert random_index.size > 0
+    size_before = random_index.size
+
+    with app.app_context():
+        db.session.add(Activity(name="Gartic Phone", url="https://garticphone.com", min_players=4, max_players=4))
+        db.session.commit()
+
+    assert random_index.size == size_before + 1
+    assert random_index.stats['rebuilds'] == 1
+
+
+def test_random_pick_survives_invalidation(monkeypatch):
+    """A pick shouldn't come up empty when another thread invalidates
+    the index just after the pick checked it was fresh.
+    """
+    index = RandomGameIndex(max_players=4)
+
+    def rebuild():
+        index._groups = {(1, 4, False): array('l', [1, 2, 3])}
+        index._buckets = index._bucket(index._groups)
+        index._built_at = time.monotonic()
+
+    ensure_fresh = index._ensure_fresh
+
+    def ensure_fresh_then_invalidate():
+        buckets = ensure_fresh()
+        index.invalidate()
+        return buckets
+
+    monkeypatch.setattr(index, 'rebuild', rebuild)
+    monkeypatch.setattr(index, '_ensure_fresh', ensure_fresh_then_invalidate)
+    assert index.pick(2) in (1, 2, 3)
+    # The next pick rebuilds it:
+    assert index.pick(2) in (1, 2, 3)
+
+
+def test_random_game_large_party(client):
+    """Parties bigger than the index covers are served straight from
+    the database.
+    """
+    rv = client.get('/v1/games/random?players=50')
+    game = rv.get_json()['game']
+
+    assert game['min_players'] <= 50
+    assert game['max_players'] is None or game['max_players'] >= 50
@@ -0,0 +1,111 @@
+"""Tests making sure Postgres actually uses our indexes for the hot queries,
+by running EXPLAIN against the statements issued over a large catalog.
+"""
+
+import contextlib
+
+import pytest
+from sqlalchemy import event, text
+
+from src.database import db
+from src.model import Activity, Submission
+
+LARGE_CATALOG_SQL = """
+insert into activity (name, url, description, paid, min_players, max_players, created_date, submitted_by)
+select
+    'Game ' || g,
+    'https://example.com/games/' || g,
+    'Synthetic game number ' || g,
+    g % 4 = 0,
+    1 + g % 6,
+    case when g % 3 = 0 then null else 1 + g % 6 + g % 10 end,
+    now() - g * interval '1 minute',
+    'test'
+from generate_series(1, 20000) g;
+
+insert into submissions (name, url, description, paid, min_players, max_players, created_date, submitted_by, approved, archived)
+select
+    'Submission ' || g,
+    'https://example.com/submissions/' || g,
+    'Synthetic submission number ' || g,
+    false, 2, null,
+    now() - g * interval '1 minute',
+    'test',
+    g % 100 <> 0 and g % 2 = 0,
+    g % 100 <> 0 and g % 2 = 1
+from generate_series(1, 20000) g;
+"""
+
+
+@pytest.fixture
+def large_app(app):
+    """The app fixture, with 20,000 more games and submissions (only a
+    handful of which are still pending) and fresh planner statistics.
+    """
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text(LARGE_CATALOG_SQL))
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text('vacuum analyze activity'))
+            connection.execute(text('vacuum analyze submissions'))
+    return app
+
+
+@contextlib.contextmanager
+def capture_statements():
+    """Records every SQL statement (and its parameters) run inside
+    the block.
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+
+def explain(statements):
+    """Returns the combined query plans for a list of captured statements.
+    """
+    plans = []
+    with db.engine.connect() as connection:
+        for statement, parameters in statements:
+            if not statement.lstrip().lower().startswith(('select', 'with')):
+                continue
+            rows = connection.exec_driver_sql(f'explain {statement}', parameters).all()
+            plans.append('\n'.join(row[0] for row in rows))
+    return '\n'.join(plans)
+
+
+@pytest.mark.parametrize('url, index', [
+    ('/v1/games?include_total=false', 'ix_activity_created_date_id'),
+    ('/v1/games?cursor=', 'ix_activity_created_date_id'),
+    ('/v1/games?price=paid&include_total=false', 'ix_activity_paid_created_date_id'),
+    ('/v1/games?price=free&cursor=', 'ix_activity_paid_created_date_id'),
+    ('/v1/games/search?query=synthetic%201234', 'ix_activity_search_vector'),
+])
+def test_game_listing_uses_indexes(large_app, client, url, index):
+    with large_app.app_context():
+        with capture_statements() as statements:
+            rv = client.get(url)
+        assert rv.status_code == 200
+        assert index in explain(statements)
+
+
+def test_random_game_uses_index(large_app):
+    with large_app.app_context():
+        with capture_statements() as statements:
+            Activity.random(1, free_only=True)
+        assert 'Index Only Scan using ix_activity_players' in explain(statements)
+
+
+def test_pending_submissions_use_partial_index(large_app):
+    with large_app.app_context():
+        with capture_statements() as statements:
+            pending = Submission.pending().all()
+        assert len(pending) == 200
+        assert 'ix_submissions_pending' in explain(statements)
@@ -0,0 +1,80 @@
+"""Tests on per-request SQL instrumentation. Statements run against an
+in-memory SQLite engine, so no Postgres is needed.
+"""
+
+import logging
+
+import pytest
+from flask import jsonify
+from sqlalchemy import create_engine, exc, text
+
+from src import create_app
+from src.instrumentation import query_instrumentation
+
+
+@pytest.fixture
+def instrumented_app():
+    """An application object with a view running `n` statements (and
+    `n` copies of the same statement if repeat is set).
+    """
+    app = create_app('src.config.TestConfig')
+    engine = create_engine('sqlite://')
+
+    @app.route('/queries/<int:n>')
+    def run_queries(n):
+        with engine.connect() as connection:
+            for i in range(n):
+                connection.execute(text('select 1') if i % 2 else text('select 2'))
+        return jsonify(ran=n)
+
+    return app
+
+
+def test_server_timing(instrumented_app):
+    rv = instrumented_app.test_client().get('/queries/3')
+
+    timings = rv.headers.getlist('Server-Timing')
+    assert timings[0].startswith('db;dur=')
+    assert timings[0].endswith('desc="3 queries"')
+    assert timings[1].startswith('app;dur=')
+
+
+def test_repeated_statements_logged(instrumented_app, caplog):
+    with caplog.at_level(logging.WARNING):
+        instrumented_app.test_client().get('/queries/8')
+        assert 'Possible N+1' not in caplog.text
+
+        instrumented_app.test_client().get('/queries/20')
+        assert 'Possible N+1 in GET /queries/20: the same statement ran 10 times' in caplog.text
+
+
+def test_slow_queries_logged(instrumented_app, caplog, monkeypatch):
+    monkeypatch.setattr(query_instrumentation, 'slow_query_ms', 0)
+
+    with caplog.at_level(logging.WARNING):
+        instrumented_app.test_client().get('/queries/1')
+
+    assert 'Slow query' in caplog.text
+    assert 'select 2' in caplog.text
+
+
+def test_failed_statements_recorded(instrumented_app, caplog, monkeypatch):
+    monkeypatch.setattr(query_instrumentation, 'slow_query_ms', 0)
+    engine = create_engine('sqlite://')
+
+    @instrumented_app.route('/failing')
+    def run_failing_query():
+        with engine.connect() as connection:
+            try:
+                connection.execute(text('select * from missing_table'))
+            except exc.OperationalError:
+                pass
+            return jsonify(info=sorted(connection.connection.info))
+
+    with caplog.at_level(logging.WARNING):
+        rv = instrumented_app.test_client().get('/failing')
+
+    assert rv.headers.getlist('Server-Timing')[0].endswith('desc="1 queries, 1 failed"')
+    # Nothing is left behind on the (pooled) connection:
+    assert rv.get_json()['info'] == []
+    assert 'failed) in GET /failing: select * from missing_table' in caplog.text
@@ -0,0 +1,95 @@
+"""Tests on the Prometheus metrics endpoint and connection pool
+settings. These don't touch the database.
+"""
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, exc
+
+from src import create_app
+from src.database import engine_options
+from src.metrics import TimedQueuePool
+from src.selection import RandomGameIndex
+
+
+@pytest.fixture
+def metrics_client():
+    return create_app('src.config.TestConfig').test_client()
+
+
+@pytest.fixture
+def app_config():
+    return dict(create_app('src.config.TestConfig').config)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_requests_counted(metrics_client):
+    before = sample('wswp_http_requests_total', method='GET', route='/v1/pulse', status='200')
+    metrics_client.get('/v1/pulse')
+
+    assert sample('wswp_http_requests_total', method='GET', route='/v1/pulse', status='200') == before + 1
+    assert sample('wswp_http_request_duration_seconds_count', method='GET', route='/v1/pulse') >= 1
+
+    rv = metrics_client.get('/metrics')
+    assert rv.status_code == 200
+    assert rv.content_type.startswith('text/plain')
+    assert b'wswp_http_requests_total{method="GET",route="/v1/pulse",status="200"}' in rv.data
+
+
+def test_auth_failures_counted(metrics_client):
+    before = sample('wswp_auth_failures_total', status='401')
+    rv = metrics_client.get('/v1/admin/submissions')
+
+    assert rv.status_code == 401
+    assert sample('wswp_auth_failures_total', status='401') == before + 1
+
+
+def test_rate_limits_counted_but_not_applied(metrics_client):
+    before = sample('wswp_rate_limited_requests_total', route='/v1/pulse')
+    statuses = [metrics_client.get('/v1/pulse').status_code for _ in range(12)]
+
+    assert 429 in statuses
+    assert sample('wswp_rate_limited_requests_total', route='/v1/pulse') > before
+    assert all(metrics_client.get('/metrics').status_code == 200 for _ in range(12))
+
+
+def test_pool_checkout_wait(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/pool.db', poolclass=TimedQueuePool, pool_size=1, max_overflow=0,
+                           pool_timeout=0.1)
+    engine.pool.label = 'test'
+
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    assert sample('wswp_db_pool_checkout_wait_seconds_count', engine='test') == 2
+    assert sample('wswp_db_pool_timeouts_total', engine='test') == 1
+
+
+def test_engine_options(app_config):
+    app_config.update(DB_STATEMENT_TIMEOUT_MS=5000)
+    options = engine_options(app_config)
+    assert options['pool_size'] == 5
+    assert options['connect_args'] == {'options': '-c statement_timeout=5000'}
+
+    # PgBouncer refuses startup options:
+    app_config.update(DB_PGBOUNCER=True)
+    assert 'connect_args' not in engine_options(app_config)
+
+
+def test_random_index_metrics(monkeypatch):
+    index = RandomGameIndex(max_players=4)
+    monkeypatch.setattr('src.selection.db.session.execute', lambda statement: [(1, 1, 4, False), (2, 2, 2, True)])
+    rebuilds = sample('wswp_random_index_rebuilds_total')
+
+    with create_app('src.config.TestConfig').app_context():
+        index.rebuild()
+    assert sample('wswp_random_index_ids') == 2
+    assert sample('wswp_random_index_bytes') == index.nbytes
+    assert sample('wswp_random_index_rebuilds_total') == rebuilds + 1
+
+    index.add([(3, 1, 2, False)])
+    assert sample('wswp_random_index_ids') == 3
@@ -0,0 +1,104 @@
+"""Tests on rate limit storage and client addresses behind proxies.
+"""
+
+import pytest
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter
+
+import src.ratelimit
+from src import create_app
+from src.auth import limiter
+from src.config import TestConfig
+from src.ratelimit import BoundedMemoryStorage
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(src.ratelimit.time, 'time', clock.time)
+    return clock
+
+
+def test_fixed_window(clock):
+    storage = storage_from_string('bounded-memory://')
+    rate_limiter = FixedWindowRateLimiter(storage)
+    limit = parse('2/second')
+
+    assert isinstance(storage, BoundedMemoryStorage)
+    assert rate_limiter.hit(limit, '1.2.3.4')
+    assert rate_limiter.hit(limit, '1.2.3.4')
+    assert not rate_limiter.hit(limit, '1.2.3.4')
+    assert rate_limiter.hit(limit, '5.6.7.8')
+
+    clock.now += 1
+    assert rate_limiter.hit(limit, '1.2.3.4')
+
+
+def test_moving_window(clock):
+    rate_limiter = MovingWindowRateLimiter(BoundedMemoryStorage())
+    limit = parse('2/minute')
+
+    assert rate_limiter.hit(limit, 'client')
+    clock.now += 30
+    assert rate_limiter.hit(limit, 'client')
+    assert not rate_limiter.hit(limit, 'client')
+
+    # The first hit drops out of the window a minute after it was made:
+    clock.now += 31
+    assert rate_limiter.get_window_stats(limit, 'client')[1] == 1
+    assert rate_limiter.hit(limit, 'client')
+
+
+def test_keys_bounded(clock):
+    storage = storage_from_string('bounded-memory://?max_keys=2')
+    for client in ('a', 'b', 'c'):
+        storage.incr(client, 60)
+        storage.acquire_entry(client, 10, 60)
+
+    assert storage.max_keys == 2
+    assert storage.get('a') == 0
+    assert storage.get('c') == 1
+    assert storage.evictions == 2
+
+
+def test_moving_window_hits_bounded(clock):
+    storage = storage_from_string('bounded-memory://?max_hits=5')
+    for client in ('a', 'b', 'c'):
+        for _ in range(2):
+            storage.acquire_entry(client, 10, 60)
+
+    # The least recently used window goes, keeping the rest:
+    assert storage.stored_hits == 4
+    assert storage.get_moving_window('a', 10, 60)[1] == 0
+    assert storage.get_moving_window('c', 10, 60)[1] == 2
+
+    # Hits leaving the window no longer count:
+    clock.now += 61
+    storage.get_moving_window('b', 10, 60)
+    assert storage.stored_hits == 2
+
+
+def test_fallback_storage_bounded():
+    create_app('src.config.TestConfig')
+    assert isinstance(limiter._fallback_storage, BoundedMemoryStorage)
+
+
+def test_client_address_behind_proxy(monkeypatch):
+    monkeypatch.setattr(TestConfig, 'TRUSTED_PROXIES', 1)
+    client = create_app('src.config.TestConfig').test_client()
+
+    def pulse(address):
+        return client.get('/v1/pulse', headers={'X-Forwarded-For': f'6.6.6.6, {address}'}).status_code
+
+    assert [pulse('1.1.1.1') for _ in range(11)][-1] == 429
+    # Only the address the proxy saw counts, not what the client claimed:
+    assert pulse('2.2.2.2') == 200
@@ -0,0 +1,196 @@
+"""Tests on routing reads to read replicas. SQLite databases stand in
+for the primary and two replicas, each holding a row saying which one
+it is.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask, jsonify, request
+from sqlalchemy import column, create_engine, table, text, update
+
+import src.replicas
+from src.cache import response_cache
+from src.database import db
+from src.replicas import replica_router
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    """An application with a primary and two replicas, and a read-only
+    view reporting which database answered.
+    """
+    urls = {}
+    for name in ('primary', 'replica_0', 'replica_1'):
+        urls[name] = f'sqlite:///{tmp_path}/{name}.db'
+        with create_engine(urls[name]).begin() as connection:
+            connection.execute(text('create table server (name text)'))
+            connection.execute(text('insert into server values (:name)'), {'name': name})
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=urls['primary'],
+        DATABASE_REPLICA_URLS=[urls['replica_0'], urls['replica_1']],
+        REPLICA_MAX_LAG_SECONDS=10,
+        REPLICA_CHECK_INTERVAL=0
+    )
+    replica_router.init_app(app)
+    db.init_app(app)
+
+    # SQLite has no replication lag to measure:
+    lags = {}
+    monkeypatch.setattr(src.replicas, 'replica_lag', lambda connection: lags.get(str(connection.engine.url)))
+    app.lags = lambda **values: lags.update({urls[name]: lag for name, lag in values.items()})
+
+    @app.route('/server', methods=['GET', 'POST'])
+    @replica_router.read_only
+    def server():
+        if request.method == 'POST' or request.args.get('write'):
+            db.session.execute(update(table('server', column('name'))).values(name=column('name')))
+            db.session.commit()
+        return jsonify(name=db.session.execute(text('select name from server')).scalar())
+
+    return app
+
+
+def served_by(client, method='GET'):
+    return client.open('/server', method=method).get_json()['name']
+
+
+def test_round_robin(replica_app):
+    client = replica_app.test_client()
+    assert [served_by(client) for _ in range(4)] == ['replica_0', 'replica_1', 'replica_0', 'replica_1']
+    assert served_by(client, 'POST') == 'primary'
+
+
+def test_lagging_replicas_skipped(replica_app):
+    client = replica_app.test_client()
+
+    replica_app.lags(replica_0=60)
+    assert {served_by(client) for _ in range(4)} == {'replica_1'}
+
+    replica_app.lags(replica_1=60)
+    assert served_by(client) == 'primary'
+    assert replica_router.stats['primary_fallback'] == 1
+
+
+def test_read_after_write(replica_app):
+    client = replica_app.test_client()
+    client.post('/server')
+
+    assert client.get_cookie(replica_router.cookie_name) is not None
+    assert served_by(client) == 'primary'
+
+    client.delete_cookie(replica_router.cookie_name)
+    assert served_by(client).startswith('replica')
+
+
+def test_one_lag_check_at_a_time(replica_app, monkeypatch):
+    """While one request checks a replica's lag, others go on what was
+    last found out about it instead of checking it too.
+    """
+    checking, finish, checks = threading.Event(), threading.Event(), []
+
+    def slow_replica_lag(connection):
+        checks.append(connection)
+        checking.set()
+        finish.wait(5)
+        return 0
+
+    monkeypatch.setattr(src.replicas, 'replica_lag', slow_replica_lag)
+    replica = replica_router.replicas[0]
+
+    def usable():
+        with replica_app.app_context():
+            return replica_router._usable(replica, time.monotonic())
+
+    thread = threading.Thread(target=usable)
+    thread.start()
+    checking.wait(5)
+    # Not checked yet, so not used:
+    assert not usable()
+    finish.set()
+    thread.join()
+
+    assert len(checks) == 1
+    assert usable()
+
+
+def test_dropped_connections_mark_replica_down(replica_app):
+    """Whether a replica's connections drop on its own engine or (under
+    the ASGI app) on its asyncpg twin, it stops being used.
+    """
+    twin = create_engine('sqlite://')
+    dropped = SimpleNamespace(is_disconnect=True, engine=twin, original_exception=ConnectionError('gone'))
+
+    with replica_app.test_request_context('/server'):
+        src.replicas._on_engine_error(dropped)
+        assert all(replica.down_until == 0 for replica in replica_router.replicas)
+
+        db.session.info['async_engines'] = {db.engines['replica_1']: twin}
+        src.replicas._on_engine_error(dropped)
+        assert replica_router.replicas[0].down_until == 0
+        assert replica_router.replicas[1].down_until > 0
+
+
+def test_replica_reads_cached_briefly(replica_app, monkeypatch):
+    """Responses read from a replica may be stale, so they're only cached
+    for as long as a replica may lag, and never served from the cache to
+    a client that just wrote something.
+    """
+    response_cache.init_app(replica_app)
+    ttls = []
+    set_entry = response_cache.backend.set
+
+    def recording_set(key, value, ttl):
+        ttls.append(ttl)
+        set_entry(key, value, ttl)
+
+    monkeypatch.setattr(response_cache.backend, 'set', recording_set)
+
+    @replica_app.route('/cached/server')
+    @replica_router.read_only
+    @response_cache.cached
+    def cached_server():
+        return jsonify(name=db.session.execute(text('select name from server')).scalar())
+
+    writer, reader = replica_app.test_client(), replica_app.test_client()
+    assert writer.get('/cached/server').headers['X-Cache'] == 'MISS'
+    assert writer.get('/cached/server').headers['X-Cache'] == 'HIT'
+    assert ttls == [10]
+
+    # A write, bumping the catalog version as a commit to the games table
+    # would, then another client's read caching what a replica says:
+    writer.post('/server')
+    response_cache.bump_version()
+    assert reader.get('/cached/server').headers['X-Cache'] == 'MISS'
+
+    rv = writer.get('/cached/server')
+    assert 'X-Cache' not in rv.headers
+    assert rv.get_json()['name'] == 'primary'
+
+
+def test_only_writes_stick_to_primary(replica_app):
+    client = replica_app.test_client()
+
+    # Reads with any method don't:
+    client.open('/server', method='OPTIONS')
+    assert client.get_cookie(replica_router.cookie_name) is None
+
+    # Committed writes do, with any method (as approving a submission
+    # is a GET):
+    client.get('/server?write=1')
+    assert client.get_cookie(replica_router.cookie_name) is not None
+    assert served_by(client) == 'primary'
+
+
+def test_writes_go_to_primary(replica_app):
+    with replica_app.test_request_context('/server'):
+        db.session.info['replica'] = db.engines['replica_0']
+        db.session.execute(update(table('server', column('name'))).values(name='written'))
+        db.session.commit()
+        assert db.session.execute(text('select name from server')).scalar() == 'replica_0'
+        db.session.info.pop('replica')
+        assert db.session.execute(text('select name from server')).scalar() == 'written'
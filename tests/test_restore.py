@@ -0,0 +1,66 @@
+"""Tests on restoring games from NDJSON dumps.
+"""
+
+import gzip
+import json
+
+from sqlalchemy import inspect
+
+from src.database import db
+from src.model import Activity
+from src.restore import copy_value
+
+
+def test_copy_value():
+    assert copy_value(None) == '\\N'
+    assert copy_value(True) == 't'
+    assert copy_value(4) == '4'
+    assert copy_value('tab\there\nand C:\\games') == 'tab\\there\\nand C:\\\\games'
+
+
+def test_restore_backup(app, runner, tmp_path):
+    with app.app_context():
+        games_before = {game.id: game.name for game in Activity.query.all()}
+
+    result = runner.invoke(args=['admin', 'backup-games', '--target', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    name = next(tmp_path.iterdir()).name
+
+    result = runner.invoke(
+        args=['admin', 'restore-games', '--backup', '--target', str(tmp_path), '--truncate', '--workers', '2',
+              '--chunk-size', '5', name],
+        input='y\n'
+    )
+    assert result.exit_code == 0, result.output
+    assert 'Restored 13 games in 3 chunks' in result.output
+
+    with app.app_context():
+        assert {game.id: game.name for game in Activity.query.all()} == games_before
+        assert 'ix_activity_search_vector' in {
+            index['name'] for index in inspect(db.engine).get_indexes('activity')
+        }
+
+        # New games carry on from the restored IDs:
+        game = Activity(name='Gartic Phone', url='https://garticphone.com', min_players=4)
+        db.session.add(game)
+        db.session.commit()
+        assert game.id == max(games_before) + 1
+
+
+def test_restore_gzip_dump(app, runner, tmp_path):
+    dump = tmp_path / 'games.ndjson.gz'
+    lines = [
+        json.dumps({'name': f'Game {i}', 'url': f'https://example.com/{i}', 'description': 'Tabs\tand\nnewlines'})
+        for i in range(10)
+    ] + ['[]']
+    dump.write_bytes(gzip.compress('\n'.join(lines).encode()))
+
+    result = runner.invoke(args=['admin', 'restore-games', '--keep-indexes', str(dump)])
+
+    assert result.exit_code == 1
+    assert 'Line 11 is not a JSON object' in result.output
+    with app.app_context():
+        game = Activity.query.filter_by(name='Game 3').one()
+        assert game.description == 'Tabs\tand\nnewlines'
+        assert game.paid is False
+        assert Activity.query.count() == 23
@@ -3,6 +3,9 @@
 
 import pytest
 
+from src.database import db
+from src.model import Activity
+
 @pytest.mark.parametrize('request_url', [
     '/v1/games/search?query=', '/v1/games/search'
 ])
@@ -42,4 +45,73 @@ def test_specific_game_search(client, search_param):
     rv = client.get(f'/v1/games/search?query={search_param}')
     json_data = rv.get_json()
 
-    assert json_data['games'][0]['name'].lower() == search_param
\ No newline at end of file
+    assert json_data['games'][0]['name'].lower() == search_param
+
+def test_search_new_game(app, client):
+    """Games added after seeding should be searchable straight away (the
+    search document is maintained by the database).
+    """
+    with app.app_context():
+        db.session.add(Activity(
+            name="Gartic Phone",
+            url="https://garticphone.com",
+            description="Telephone game with drawings",
+            min_players=4
+        ))
+        db.session.commit()
+
+    rv = client.get('/v1/games/search?query=gartic')
+    json_data = rv.get_json()
+    assert [game['name'] for game in json_data['games']] == ["Gartic Phone"]
+
+
+@pytest.mark.parametrize('page, per_page, exp_games, exp_next_page, exp_total_pages', [
+    (1, 2, 2, 2, 3),
+    (3, 2, 1, None, 3),
+    (4, 2, 0, None, 3),
+    (1, 5, 5, None, 1)
+])
+def test_search_pagination(client, page, per_page, exp_games, exp_next_page, exp_total_pages):
+    """Paging through search results ('online' matches 5 games) should
+    report the right number of pages, including past the last page.
+    """
+    rv = client.get(f'/v1/games/search?query=online&page={page}&per_page={per_page}')
+    json_data = rv.get_json()
+
+    assert rv.status_code == 200
+    assert len(json_data['games']) == exp_games
+    assert json_data['next_page'] == exp_next_page
+    assert json_data['total_pages'] == exp_total_pages
+
+
+@pytest.mark.parametrize('page, per_page', [(0, 10), (1, 0), ('a', 10)])
+def test_search_invalid_pagination(client, page, per_page):
+    rv = client.get(f'/v1/games/search?query=online&page={page}&per_page={per_page}')
+    assert rv.status_code == 400
+
+
+def test_search_title_matches_first(client):
+    """Games matching on their title should rank above games that only
+    match on their description.
+    """
+    rv = client.get('/v1/games/search?query=monopoly')
+    json_data = rv.get_json()
+
+    assert json_data['games'][0]['name'] == 'Monopoly Deal'
+
+
+@pytest.mark.parametrize('highlight', ['true', 'false'])
+def test_search_headlines(client, highlight):
+    """Headlines should only be included when asked for, with matching
+    words marked.
+    """
+    rv = client.get(f'/v1/games/search?query=deduction&highlight={highlight}')
+    games = rv.get_json()['games']
+
+    assert len(games) == 3
+    for game in games:
+        if highlight == 'true':
+            assert '<mark>' in game['headline']
+            assert 'deduction' in game['headline'].lower()
+        else:
+            assert 'headline' not in game
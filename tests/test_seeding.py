@@ -0,0 +1,31 @@
+"""Tests on seeding the games table.
+"""
+
+from sqlalchemy import inspect
+
+from src.database import db
+from src.model import Activity
+
+
+def test_seed_db_is_idempotent(app, runner):
+    result = runner.invoke(args=['admin', 'seed-db'])
+
+    assert result.exit_code == 0, result.output
+    assert '0 added, 13 already there' in result.output
+    with app.app_context():
+        assert Activity.query.count() == 13
+
+
+def test_seed_db_at_scale(app, runner):
+    result = runner.invoke(args=['admin', 'seed-db', '--scale', '1000'])
+    assert result.exit_code == 0, result.output
+    assert 'Generated 1000 synthetic games' in result.output
+
+    result = runner.invoke(args=['admin', 'seed-db', '--scale', '1500'])
+    assert 'Generated 500 synthetic games' in result.output
+
+    with app.app_context():
+        assert Activity.query.count() == 1513
+        assert Activity.query.filter(Activity.max_players < Activity.min_players).count() == 0
+        index_names = {index['name'] for index in inspect(db.engine).get_indexes('activity')}
+        assert {'ix_activity_search_vector', 'ix_activity_url'} <= index_names
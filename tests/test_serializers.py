@@ -0,0 +1,35 @@
+"""Tests on the fast serialization path for games.
+"""
+
+import datetime
+from collections import namedtuple
+
+import pytest
+from flask import jsonify
+
+from src import create_app
+from src.model import ACTIVITY_FIELDS
+from src.schema import ActivitySchema
+from src.serializers import dump_games, json_response
+
+Row = namedtuple('Row', ACTIVITY_FIELDS)
+
+ROWS = [
+    Row(1, 'Café "Crush" </script>', 'https://example.com/1', 'Emoji 😀 and separators',
+        False, 1, None, datetime.datetime(2021, 1, 2, 3, 4, 5, 123456), 'someone'),
+    Row(2, 'Codenames', 'https://example.com/2', None, True, 4, 8, None, None),
+    Row(3, 'Skribbl', 'https://example.com/3', '', False, 2, 12, datetime.datetime(2021, 1, 2), ''),
+]
+
+
+@pytest.mark.parametrize('debug', [False, True])
+def test_matches_schema_and_jsonify(debug):
+    app = create_app('src.config.TestConfig')
+    app.debug = debug
+
+    with app.test_request_context():
+        expected = jsonify(games=ActivitySchema().dump(ROWS, many=True), page=1, next_page=None)
+        rv = json_response(dict(games=dump_games(ROWS), page=1, next_page=None))
+
+    assert rv.get_data() == expected.get_data()
+    assert rv.mimetype == expected.mimetype
@@ -0,0 +1,28 @@
+"""Tests on the serving app factory, which leaves out what's only needed
+for admin commands.
+"""
+
+import subprocess
+import sys
+
+from src import create_app, create_serving_app
+
+
+def test_serving_app_leaves_out_admin_tools():
+    full = create_app('src.config.TestConfig')
+    serving = create_serving_app('src.config.TestConfig')
+
+    assert 'migrate' in full.extensions and 'admin' in full.cli.commands
+    assert 'migrate' not in serving.extensions
+    assert 'admin' not in serving.cli.commands
+    assert serving.test_client().get('/v1/pulse').status_code == 200
+
+
+def test_serving_app_imports_lazily():
+    # (In a new interpreter, since other tests import all of these.)
+    probe = (
+        "import sys; from src import create_serving_app; create_serving_app('src.config.TestConfig');"
+        "print(' '.join(m for m in ('flask_migrate', 'src.cli', 'src.schema', 'jose', 'requests') if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, '-c', probe], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == ''
@@ -4,7 +4,11 @@ form is validated properly and passed to the backend.
 
 import pytest
 import pathlib, json
+from src import create_app
+from src.config import TestConfig
+from src.database import db
 from src.model import Activity, Submission
+from src.replicas import replica_router
 
 # Load in sample submissions and their expected status codes if they were submitted:
 with open(pathlib.Path(__file__).parent.absolute()/'data'/'sample_submissions_base.json') as samples:
@@ -56,3 +60,25 @@ def test_blank_max_players(app, client, max_players):
         # record has NULL max_players
         game = Submission.query.filter_by(name="TestMaxPlayersBlank").first()
         assert game.max_players is None
+
+
+def test_approving_reads_from_primary(app, monkeypatch):
+    """Approving a submission is a GET, but it writes a game, so the
+    admin's next reads come from the primary (and skip the cache).
+    """
+    monkeypatch.setattr(TestConfig, 'DATABASE_REPLICA_URLS', [TestConfig.SQLALCHEMY_DATABASE_URI])
+    monkeypatch.setattr('src.auth.verify_token', lambda token: {'sub': 'admin'})
+    replica_app = create_app('src.config.TestConfig')
+    with replica_app.app_context():
+        submission = Submission(name="Gartic Phone", url="https://garticphone.com", min_players=4)
+        db.session.add(submission)
+        db.session.commit()
+        submission_id = submission.id
+
+    client = replica_app.test_client()
+    rv = client.get(f'/v1/admin/submissions/approve/{submission_id}', headers={'Authorization': 'Bearer token'})
+
+    assert rv.status_code == 200
+    assert client.get_cookie(replica_router.cookie_name) is not None
+    assert 'X-Cache' not in client.get('/v1/games').headers
+    assert replica_router.stats['primary_after_write'] == 1